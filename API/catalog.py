@@ -0,0 +1,53 @@
+import threading
+from typing import Dict, Iterable, Optional
+from API.models import Product
+
+class BarcodeIndex:
+    # Mapa codigo_barras -> produto mantido em memória para as leituras dos PDVs
+    def __init__(self):
+        self._by_barcode: Dict[str, Product] = {}
+        self._barcode_by_id: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def load(self, products: Iterable[Product]):
+        by_barcode = {}
+        barcode_by_id = {}
+        for product in products:
+            if product.codigo_barras:
+                by_barcode[product.codigo_barras] = product
+                barcode_by_id[product.id] = product.codigo_barras
+        with self._lock:
+            self._by_barcode = by_barcode
+            self._barcode_by_id = barcode_by_id
+            self.loaded = True
+
+    def get(self, codigo_barras: str) -> Optional[Product]:
+        return self._by_barcode.get(codigo_barras)
+
+    def put(self, product: Product):
+        with self._lock:
+            old_barcode = self._barcode_by_id.pop(product.id, None)
+            if old_barcode is not None:
+                self._by_barcode.pop(old_barcode, None)
+            if product.codigo_barras:
+                self._by_barcode[product.codigo_barras] = product
+                self._barcode_by_id[product.id] = product.codigo_barras
+
+    def remove(self, product_id: int):
+        with self._lock:
+            old_barcode = self._barcode_by_id.pop(product_id, None)
+            if old_barcode is not None:
+                self._by_barcode.pop(old_barcode, None)
+
+    def update_stock(self, product_id: int, estoque: int):
+        with self._lock:
+            barcode = self._barcode_by_id.get(product_id)
+            product = self._by_barcode.get(barcode) if barcode is not None else None
+            if product is not None:
+                self._by_barcode[barcode] = product.model_copy(update={'estoque_inicial': estoque})
+
+    def __len__(self):
+        return len(self._by_barcode)
+
+barcode_index = BarcodeIndex()
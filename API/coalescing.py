@@ -0,0 +1,54 @@
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Requisições idênticas simultâneas compartilham uma única consulta em andamento
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._counts = defaultdict(lambda: {'queries': 0, 'coalesced': 0})
+        self._lock = threading.Lock()
+
+    def do(self, key: Tuple, func: Callable, *args, **kwargs) -> Any:
+        # key[0] identifica a rota nas métricas; o restante são os parâmetros normalizados
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._counts[key[0]]['queries' if leader else 'coalesced'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def metrics(self) -> dict:
+        with self._lock:
+            in_flight = defaultdict(int)
+            for key in self._calls:
+                in_flight[key[0]] += 1
+            return {route: {**counts, 'in_flight': in_flight[route]} for route, counts in self._counts.items()}
+
+
+read_flight = SingleFlight()
@@ -6,7 +6,8 @@ def generate_secret_key():
     os.environ['SECRET_KEY'] = secret_key
 
 def get_secret_key():
+    # Gerada sob demanda (sem efeitos colaterais no import); o lançador importa a aplicação
+    # antes do fork, então todos os workers compartilham a mesma chave
+    if not os.environ.get('SECRET_KEY'):
+        generate_secret_key()
     return os.environ.get('SECRET_KEY')
-
-if not os.environ.get('SECRET_KEY'):
-    generate_secret_key()
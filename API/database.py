@@ -1,9 +1,23 @@
-from datetime import datetime
-from typing import List, Optional
+from collections import Counter
+from datetime import date, datetime
+from typing import Iterator, List, Optional
+import json
+import re
+import asyncio
+import threading
+import time
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
 from passlib.context import CryptContext
 from psycopg2 import sql
-from API.models import ClientUpdate, Order, OrderCreate, OrderItem, Product, ProductCreate, UserCreate, User, ClientCreate, Client
+from psycopg2.extras import Json, execute_values
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import Response
+from API.catalog import barcode_index
+from API.models import ClientChanges, ClientUpdate, Order, OrderBatchResult, OrderCreate, OrderItem, Product, ProductBulkResult, ProductChanges, ProductCreate, ProductPatch, ProductSales, SecaoSales, UserCreate, User, ClientCreate, Client
 import os
 from dotenv import load_dotenv
 
@@ -11,10 +25,480 @@ load_dotenv()
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+
+# Prazos por requisição, em segundos: viram statement_timeout/lock_timeout da sessão
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "10"))
+LOCK_TIMEOUT = float(os.getenv("LOCK_TIMEOUT", "2"))
+
+def parse_route_deadlines(value: Optional[str]) -> dict:
+    # Formato: "GET /orders=30,POST /orders/batch=20"
+    deadlines = {}
+    for entry in (value or '').split(','):
+        if not entry.strip():
+            continue
+        route, _, seconds = entry.rpartition('=')
+        deadlines[' '.join(route.split())] = float(seconds)
+    return deadlines
+
+ROUTE_DEADLINES = {
+    'GET /orders': 30,
+    'POST /orders/batch': 20,
+    'PATCH /products': 20,
+    'GET /reports/sales/secao': 30,
+    'GET /reports/sales/top-products': 30,
+    **parse_route_deadlines(os.getenv("ROUTE_DEADLINES")),
+}
+
+# Réplica de leitura opcional: GETs vão para ela enquanto o atraso ficar abaixo de REPLICA_MAX_LAG
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "1"))
+PRIMARY_COOKIE = "lc_primary_until"
+# Após uma escrita, as leituras da sessão ficam no primário até a réplica poder ter alcançado a escrita
+PRIMARY_STICKY_SECONDS = REPLICA_MAX_LAG + REPLICA_LAG_CHECK_INTERVAL
+# A sincronização delta usa txid_current(), indisponível em réplicas
+PRIMARY_ROUTES = {'GET /products/changes', 'GET /clients/changes'}
+
 def get_connection():
     db_url = os.getenv("DATABASE_URL")
     return psycopg2.connect(db_url)
 
+##### Pool de conexões #####
+
+class PoolTimeout(PoolError):
+    pass
+
+class BlockingConnectionPool(ThreadedConnectionPool):
+    # Aguarda uma conexão livre em vez de lançar PoolError quando o pool está esgotado
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        self._slots = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None, timeout=None):
+        if not self._slots.acquire(timeout=timeout):
+            raise PoolTimeout("Nenhuma conexão livre no pool dentro do prazo")
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+class PreparedConnection(psycopg2.extensions.connection):
+    # Guarda os comandos já preparados nesta sessão do Postgres
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.timeouts = None
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+def get_pool(role: str = 'write') -> BlockingConnectionPool:
+    # Criados sob demanda para que cada worker abra os seus próprios pools depois do fork
+    if role == 'read' and not READ_DATABASE_URL:
+        role = 'write'
+    pool = _pools.get(role)
+    if pool is None:
+        with _pool_lock:
+            if role not in _pools:
+                _pools[role] = BlockingConnectionPool(
+                    DB_POOL_MIN, DB_POOL_MAX, READ_DATABASE_URL if role == 'read' else os.getenv("DATABASE_URL"),
+                    connection_factory=PreparedConnection,
+                )
+            pool = _pools[role]
+    return pool
+
+_route_keys = {}
+
+def route_key(request: Request) -> str:
+    # Chave "MÉTODO /caminho/{param}" resolvida uma vez por rota a partir do endpoint
+    endpoint = request.scope.get('endpoint')
+    cache_key = (request.method, endpoint)
+    if cache_key not in _route_keys:
+        path = next((route.path for route in request.app.routes if getattr(route, 'endpoint', None) is endpoint), request.url.path)
+        _route_keys[cache_key] = f"{request.method} {path}"
+    return _route_keys[cache_key]
+
+def route_deadline(request: Request) -> float:
+    return ROUTE_DEADLINES.get(route_key(request), REQUEST_DEADLINE)
+
+##### Roteamento leitura/escrita #####
+
+REPLICA_LAG_QUERY = """
+    SELECT COALESCE(CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END, 0)
+"""
+
+class ReplicaMonitor:
+    # Mede o atraso da réplica no máximo uma vez por intervalo; as demais requisições usam o último valor
+    def __init__(self):
+        self.lag = None
+        self.healthy = False
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def usable(self) -> bool:
+        stale = time.monotonic() - self.checked_at > REPLICA_LAG_CHECK_INTERVAL
+        if stale and self._lock.acquire(blocking=False):
+            try:
+                self.check()
+            finally:
+                self._lock.release()
+        return self.healthy
+
+    def check(self):
+        try:
+            pool = get_pool('read')
+            conn = pool.getconn(timeout=REPLICA_LAG_CHECK_INTERVAL)
+        except (psycopg2.Error, PoolError):
+            self.mark_down()
+            return
+        try:
+            with conn.cursor() as cur:
+                cur.execute(REPLICA_LAG_QUERY)
+                self.lag = float(cur.fetchone()[0])
+            self.healthy = self.lag <= REPLICA_MAX_LAG
+        except psycopg2.Error:
+            self.lag = None
+            self.healthy = False
+        finally:
+            _release(pool, conn)
+            self.checked_at = time.monotonic()
+
+    def mark_down(self):
+        self.lag = None
+        self.healthy = False
+        self.checked_at = time.monotonic()
+
+replica_monitor = ReplicaMonitor()
+_routing_counts = Counter()
+_routing_lock = threading.Lock()
+
+def _count_route(target: str):
+    with _routing_lock:
+        _routing_counts[target] += 1
+
+def routing_metrics() -> dict:
+    with _routing_lock:
+        counts = dict(_routing_counts)
+    return {**counts, 'replica_configured': bool(READ_DATABASE_URL), 'replica_lag': replica_monitor.lag}
+
+def connection_role(request: Request) -> str:
+    # GETs podem ir para a réplica, exceto logo após uma escrita da mesma sessão (cookie)
+    if request.method != 'GET' or not READ_DATABASE_URL or route_key(request) in PRIMARY_ROUTES:
+        return 'write'
+    try:
+        if float(request.cookies.get(PRIMARY_COOKIE, 0)) > time.time():
+            return 'write'
+    except ValueError:
+        pass
+    return 'read'
+
+def set_timeouts(conn, statement_ms: int, lock_ms: int):
+    # Só fala com o banco quando o prazo desta rota difere do da requisição anterior
+    if getattr(conn, 'timeouts', None) == (statement_ms, lock_ms):
+        return
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT set_config('statement_timeout', %s, false), set_config('lock_timeout', %s, false)",
+            (str(statement_ms), str(lock_ms)),
+        )
+    conn.commit()  # Sem o commit, o rollback ao devolver a conexão desfaria o SET
+    conn.timeouts = (statement_ms, lock_ms)
+
+async def _cancel_on_disconnect(request: Request, conn):
+    # Cancela a consulta em andamento se o cliente HTTP desistir da requisição
+    while True:
+        message = await request.receive()
+        if message['type'] == 'http.disconnect':
+            request.state.client_disconnected = True
+            await run_in_threadpool(conn.cancel)
+            return
+
+def _release(pool, conn):
+    broken = bool(conn.closed)
+    if not broken:
+        try:
+            conn.rollback()  # Descarta qualquer transação deixada aberta pela rota
+        except psycopg2.Error:
+            broken = True
+    pool.putconn(conn, close=broken)
+
+def _acquire(deadline: float, role: str = 'write'):
+    if role == 'read' and replica_monitor.usable():
+        try:
+            pool = get_pool('read')
+            conn = pool.getconn(timeout=deadline)
+            _count_route('read')
+        except psycopg2.OperationalError:
+            replica_monitor.mark_down()
+            role = 'fallback'
+    elif role == 'read':
+        role = 'fallback'
+    if role != 'read':
+        _count_route(role)
+        pool = get_pool()
+        conn = pool.getconn(timeout=deadline)
+    try:
+        statement_ms = int(deadline * 1000)
+        set_timeouts(conn, statement_ms, min(int(LOCK_TIMEOUT * 1000), statement_ms))
+    except BaseException:
+        _release(pool, conn)
+        raise
+    return pool, conn
+
+def run_with_connection(deadline: float, func, *args, role: str = 'write'):
+    # Para leituras fora do ciclo de get_db (ex.: a consulta compartilhada do single-flight)
+    pool, conn = _acquire(deadline, role)
+    try:
+        return func(conn, *args)
+    finally:
+        _release(pool, conn)
+
+async def get_db(request: Request, response: Response):
+    role = connection_role(request)
+    if request.method != 'GET' and READ_DATABASE_URL:
+        # Leitura após escrita: as próximas leituras desta sessão ficam no primário
+        response.set_cookie(PRIMARY_COOKIE, str(int(time.time() + PRIMARY_STICKY_SECONDS) + 1), max_age=int(PRIMARY_STICKY_SECONDS) + 1, httponly=True)
+    pool, conn = await run_in_threadpool(_acquire, route_deadline(request), role)
+    watcher = asyncio.create_task(_cancel_on_disconnect(request, conn))
+    try:
+        yield conn
+    finally:
+        watcher.cancel()
+        # Um cancelamento já enviado termina antes de a conexão voltar ao pool
+        await asyncio.gather(watcher, return_exceptions=True)
+        await run_in_threadpool(_release, pool, conn)
+
+##### Campos selecionáveis #####
+
+# Listas brancas para o parâmetro fields= das rotas de leitura
+CLIENT_FIELDS = ('id', 'nome', 'email', 'cpf')
+PRODUCT_FIELDS = ('id', 'descricao', 'valor_venda', 'codigo_barras', 'secao', 'estoque_inicial', 'data_validade', 'imagens')
+ORDER_FIELDS = ('id', 'client_id', 'total', 'created_at', 'client', 'items')
+
+def select_fields(conn, table: str, fields, row_id: Optional[int] = None) -> List[dict]:
+    query = sql.SQL("SELECT {columns} FROM {table}").format(
+        columns=sql.SQL(', ').join(map(sql.Identifier, fields)),
+        table=sql.Identifier(table),
+    )
+    if row_id is not None:
+        query += sql.SQL(" WHERE id = %s")
+    with conn.cursor() as cur:
+        cur.execute(query, (row_id,) if row_id is not None else None)
+        return [dict(zip(fields, row)) for row in cur.fetchall()]
+
+##### Listas em streaming #####
+
+# Linhas lidas por vez do cursor no servidor; limita a memória de cada requisição de listagem
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+
+def _json_object(columns) -> sql.Composable:
+    return sql.SQL("json_build_object({})").format(sql.SQL(', ').join(
+        sql.SQL("{}, {}").format(sql.Literal(column), sql.Identifier(column)) for column in columns
+    ))
+
+def iter_batches(conn, query: sql.Composable, params=None, batch_size: Optional[int] = None) -> Iterator[list]:
+    # Cursor nomeado: o resultado fica no servidor e chega ao Python um lote por vez
+    batch_size = batch_size or STREAM_BATCH_SIZE
+    with conn.cursor(name='batch_stream') as cur:
+        cur.itersize = batch_size
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                return
+            yield rows
+
+class QueryStream:
+    """Array JSON lido de um cursor no servidor, lote a lote.
+
+    A conexão, o prazo e o primeiro lote são resolvidos no construtor, ainda dentro da rota: pool esgotado
+    ou prazo estourado viram 503/504 em vez de um 200 com corpo truncado.
+    """
+
+    def __init__(self, deadline: float, query: sql.Composable, params=None, role: str = 'write', encode=None):
+        self.pool, self.conn = _acquire(deadline, role)
+        self.encode = encode
+        self._lock = threading.Lock()
+        self._started = False
+        try:
+            self._batches = iter_batches(self.conn, query, params)
+            self._first = next(self._batches, None)
+        except BaseException:
+            self.close()
+            raise
+
+    def _chunk(self, rows) -> bytes:
+        return ','.join(row[0] if self.encode is None else self.encode(row[0]) for row in rows).encode()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        if not self._started:
+            self._started = True
+            return b'[' + (self._chunk(self._first) if self._first else b'')
+        if self.conn is None:
+            raise StopIteration
+        rows = next(self._batches, None) if self._first else None
+        if rows:
+            return b',' + self._chunk(rows)
+        # Fim do resultado: a conexão volta ao pool antes do último pedaço ser enviado
+        self.close()
+        return b']'
+
+    def cancel(self):
+        # Cliente desconectou: interrompe o FETCH em andamento
+        with self._lock:
+            if self.conn is not None:
+                self.conn.cancel()
+
+    def close(self):
+        with self._lock:
+            if self.conn is None:
+                return
+            conn, self.conn = self.conn, None
+            batches = getattr(self, '_batches', None)
+            if batches is not None:
+                try:
+                    batches.close()
+                except psycopg2.Error:
+                    pass
+            _release(self.pool, conn)
+
+def stream_json_array(deadline: float, query: sql.Composable, params=None, role: str = 'write', encode=None) -> QueryStream:
+    # Cada linha já chega como JSON (ou é codificada por encode)
+    return QueryStream(deadline, query, params, role, encode)
+
+def stream_table(deadline: float, table: str, fields, role: str = 'write') -> QueryStream:
+    query = sql.SQL("SELECT {object}::text FROM {table} ORDER BY id").format(
+        object=_json_object(fields), table=sql.Identifier(table),
+    )
+    return stream_json_array(deadline, query, role=role)
+
+##### Comandos preparados #####
+
+# Consultas mais frequentes: preparadas uma vez por conexão e executadas por nome
+PREPARED_STATEMENTS = {
+    "get_user": "SELECT id, username, email, primeiro_nome, segundo_nome, hashed_password FROM users WHERE username = $1",
+    "get_client_id": "SELECT id, nome, email, cpf FROM clients WHERE id = $1",
+    "get_product_id": "SELECT id, descricao, valor_venda, codigo_barras, secao, estoque_inicial, data_validade, imagens FROM products WHERE id = $1",
+    "get_product_barcode": "SELECT id, descricao, valor_venda, codigo_barras, secao, estoque_inicial, data_validade, imagens FROM products WHERE codigo_barras = $1",
+    "update_product_stock": """
+        UPDATE products
+        SET estoque_inicial = estoque_inicial - $1
+        WHERE id = $2 AND estoque_inicial - $1 >= 0
+        RETURNING id, estoque_inicial, secao
+    """,
+}
+
+_PARAM = re.compile(r"\$(\d+)")
+_ADHOC_STATEMENTS = {name: _PARAM.sub(r"%(p\1)s", query) for name, query in PREPARED_STATEMENTS.items()}
+_PARAM_COUNT = {name: len(set(_PARAM.findall(query))) for name, query in PREPARED_STATEMENTS.items()}
+
+_statement_counts = {"prepared": Counter(), "adhoc": Counter()}
+_statement_lock = threading.Lock()
+
+def _count_statement(kind: str, name: str):
+    with _statement_lock:
+        _statement_counts[kind][name] += 1
+
+def statement_metrics() -> dict:
+    with _statement_lock:
+        return {kind: dict(counts) for kind, counts in _statement_counts.items()}
+
+def prepare_statement(cur, name: str):
+    cur.execute(sql.SQL("PREPARE {} AS ").format(sql.Identifier(name)) + sql.SQL(PREPARED_STATEMENTS[name]))
+    cur.connection.prepared.add(name)
+
+def prepare_statements(conn):
+    with conn.cursor() as cur:
+        for name in PREPARED_STATEMENTS:
+            if name not in conn.prepared:
+                prepare_statement(cur, name)
+
+def execute_statement(cur, name: str, params: tuple):
+    prepared = getattr(cur.connection, "prepared", None)
+    if prepared is None:
+        # Conexões fora do pool (ex.: get_connection) executam o SQL diretamente
+        cur.execute(_ADHOC_STATEMENTS[name], {f"p{i + 1}": value for i, value in enumerate(params)})
+        _count_statement("adhoc", name)
+        return
+    if name not in prepared:
+        prepare_statement(cur, name)
+    placeholders = sql.SQL(", ").join([sql.Placeholder()] * _PARAM_COUNT[name])
+    cur.execute(sql.SQL("EXECUTE {} ({})").format(sql.Identifier(name), placeholders), params)
+    _count_statement("prepared", name)
+
+##### Aquecimento #####
+
+def ensure_schema(conn):
+    create_user_table(conn)
+    create_client_table(conn)
+    create_product_table(conn)
+    create_product_indexes(conn)
+    create_product_images_table(conn)
+    create_orders_table(conn)
+    create_sales_tables(conn)
+    create_change_tracking(conn)
+    create_jobs_table(conn)
+    create_idempotency_table(conn)
+
+def warm_up():
+    pool = get_pool()
+    # Abre as conexões mínimas do pool e valida cada uma antes de receber tráfego
+    conns = [pool.getconn() for _ in range(DB_POOL_MIN)]
+    try:
+        ensure_schema(conns[0])
+        for conn in conns:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            prepare_statements(conn)
+            conn.rollback()
+        # Carrega o catálogo (cache de páginas do Postgres e índice de códigos de barras em memória)
+        barcode_index.load(get_all_products(conns[0]))
+        conns[0].rollback()
+    finally:
+        for conn in conns:
+            pool.putconn(conn, close=bool(conn.closed))
+    if READ_DATABASE_URL:
+        warm_up_replica()
+
+def warm_up_replica():
+    # Réplica indisponível não impede o serviço de ficar pronto: as leituras caem no primário
+    try:
+        pool = get_pool('read')
+        conns = [pool.getconn() for _ in range(DB_POOL_MIN)]
+    except psycopg2.Error as exc:
+        print(f'WARNING:  Réplica de leitura indisponível ({exc}); leituras seguem no primário')
+        replica_monitor.mark_down()
+        return
+    try:
+        for conn in conns:
+            prepare_statements(conn)
+            conn.rollback()
+    finally:
+        for conn in conns:
+            pool.putconn(conn, close=bool(conn.closed))
+    replica_monitor.check()
+
+def close_pool():
+    with _pool_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
+
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)   
 
@@ -77,9 +561,8 @@ def create_user(conn, user: UserCreate):
             return None
 
 def get_user(conn, username: str):
-    query = sql.SQL("SELECT id, username, email, primeiro_nome, segundo_nome, hashed_password FROM users WHERE username = %s")
     with conn.cursor() as cur:
-        cur.execute(query, (username,))
+        execute_statement(cur, "get_user", (username,))
         row = cur.fetchone()
         if row:
             user_data = {
@@ -121,7 +604,7 @@ def create_client_table(conn):
         conn.commit()
 
 
-def create_client(conn, client: ClientCreate):
+def create_client(conn, client: ClientCreate, commit: bool = True):
     create_client_table(conn)
 
     if client_exists(conn, client.email, client.cpf):
@@ -139,7 +622,8 @@ def create_client(conn, client: ClientCreate):
     with conn.cursor() as cur:
         cur.execute(query, (nome, email, cpf))
         row = cur.fetchone()
-        conn.commit()
+        if commit:
+            conn.commit()
         if row:
             client_data = {
                 'id': row[0],
@@ -152,10 +636,12 @@ def create_client(conn, client: ClientCreate):
             return None
 
 
-def get_client_id(conn, client_id: int):
-    query = sql.SQL("SELECT id, nome, email, cpf FROM clients WHERE id = %s")
+def get_client_id(conn, client_id: int, fields=None):
+    if fields:
+        rows = select_fields(conn, 'clients', fields, client_id)
+        return rows[0] if rows else None
     with conn.cursor() as cur:
-        cur.execute(query, (client_id,))
+        execute_statement(cur, "get_client_id", (client_id,))
         row = cur.fetchone()
         if row:
             client_data = {
@@ -238,6 +724,140 @@ def create_product_table(conn):
         """)
         conn.commit()
 
+# Mesma expressão do índice GIN, para que o planejador consiga utilizá-lo
+PRODUCT_SEARCH_VECTOR = "to_tsvector('portuguese', descricao || ' ' || COALESCE(secao, ''))"
+
+_trigram_enabled = False
+
+def create_product_indexes(conn):
+    global _trigram_enabled
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS products_search_idx ON products USING GIN ({PRODUCT_SEARCH_VECTOR})")
+        conn.commit()
+        try:
+            cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS products_codigo_barras_key ON products (codigo_barras) WHERE codigo_barras IS NOT NULL")
+            conn.commit()
+        except psycopg2.errors.UniqueViolation:
+            # Códigos duplicados já cadastrados: mantém a busca indexada sem a restrição de unicidade
+            conn.rollback()
+            cur.execute("CREATE INDEX IF NOT EXISTS products_codigo_barras_idx ON products (codigo_barras)")
+            conn.commit()
+            print("WARNING:  Existem códigos de barras duplicados; índice único não criado")
+        try:
+            cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cur.execute("CREATE INDEX IF NOT EXISTS products_descricao_trgm_idx ON products USING GIN (descricao gin_trgm_ops)")
+            conn.commit()
+            _trigram_enabled = True
+        except psycopg2.Error as exc:
+            # Sem pg_trgm a busca continua por texto completo e prefixo, só sem tolerância a erros de digitação
+            conn.rollback()
+            _trigram_enabled = False
+            print(f"WARNING:  Extensão pg_trgm indisponível ({exc.pgerror or exc})")
+
+# Canal do LISTEN/NOTIFY com as mudanças de estoque e preço; entregue aos ouvintes só após o commit
+PRODUCT_CHANNEL = "product_changes"
+
+def product_event(op: str, product_id: int, secao=None, valor_venda=None, estoque_inicial=None, codigo_barras=None, product=None) -> dict:
+    event = {
+        'op': op,
+        'id': product_id,
+        'secao': secao,
+        'valor_venda': float(valor_venda) if valor_venda is not None else None,
+        'estoque_inicial': estoque_inicial,
+        'codigo_barras': codigo_barras
+    }
+    if product is not None:
+        # Produto completo: os outros workers atualizam o índice de códigos de barras sem ir ao banco
+        event['product'] = product
+    return event
+
+def _product_row_event(op: str, row) -> dict:
+    # row segue a ordem de colunas usada nas consultas de produtos
+    product = Product(**dict(zip(PRODUCT_FIELDS, row))).model_dump(mode='json')
+    return product_event(op, row[0], secao=row[4], valor_venda=row[2], estoque_inicial=row[5], codigo_barras=row[3], product=product)
+
+NOTIFY_PAYLOAD_LIMIT = 7900
+
+def _event_payload(event: dict) -> str:
+    payload = json.dumps(event)
+    if len(payload.encode()) > NOTIFY_PAYLOAD_LIMIT and 'product' in event:
+        # Acima do limite do NOTIFY o produto vai sem o corpo; quem recebe descarta a entrada em cache
+        payload = json.dumps({key: value for key, value in event.items() if key != 'product'})
+    return payload
+
+def notify_product_changes(cur, events: List[dict]):
+    if events:
+        cur.execute(
+            "SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload",
+            (PRODUCT_CHANNEL, [_event_payload(event) for event in events])
+        )
+
+def create_product_images_table(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS product_images (
+                product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+                digest CHAR(64) NOT NULL,
+                extension VARCHAR(8) NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                status VARCHAR(10) NOT NULL DEFAULT 'pending',
+                variants JSONB NOT NULL DEFAULT '{}',
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (product_id, digest)
+            )
+        """)
+        conn.commit()
+
+PRODUCT_IMAGE_COLUMNS = "digest, extension, width, height, status, variants, created_at"
+
+def add_product_image(conn, product_id: int, digest: str, extension: str, width: int, height: int) -> dict:
+    with conn.cursor() as cur:
+        try:
+            # Reenvio da mesma imagem volta a ficar pendente para regerar as variantes
+            cur.execute(f"""
+                INSERT INTO product_images (product_id, digest, extension, width, height)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (product_id, digest) DO UPDATE SET status = 'pending'
+                RETURNING {PRODUCT_IMAGE_COLUMNS}
+            """, (product_id, digest, extension, width, height))
+        except psycopg2.errors.ForeignKeyViolation:
+            conn.rollback()
+            raise ValueError("Produto não encontrado")
+        row = cur.fetchone()
+    conn.commit()
+    return dict(zip(PRODUCT_IMAGE_COLUMNS.split(', '), row))
+
+def get_product_images(conn, product_id: int) -> List[dict]:
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT {PRODUCT_IMAGE_COLUMNS} FROM product_images WHERE product_id = %s ORDER BY created_at, digest",
+            (product_id,),
+        )
+        return [dict(zip(PRODUCT_IMAGE_COLUMNS.split(', '), row)) for row in cur.fetchall()]
+
+def set_product_image_variants(conn, product_id: int, digest: str, url: str, variants: dict):
+    # Variantes prontas: a URL do original entra em products.imagens e os assinantes do feed são avisados
+    with conn.cursor() as cur:
+        cur.execute(
+            "UPDATE product_images SET status = 'ready', variants = %s WHERE product_id = %s AND digest = %s",
+            (Json(variants), product_id, digest),
+        )
+        cur.execute("""
+            UPDATE products SET imagens = array_append(COALESCE(imagens, '{}'), %s)
+            WHERE id = %s AND NOT (%s = ANY(COALESCE(imagens, '{}')))
+            RETURNING id, descricao, valor_venda, codigo_barras, secao, estoque_inicial, data_validade, imagens
+        """, (url, product_id, url))
+        row = cur.fetchone()
+        if row:
+            notify_product_changes(cur, [_product_row_event('update', row)])
+    conn.commit()
+
+def fail_product_image(conn, product_id: int, digest: str):
+    with conn.cursor() as cur:
+        cur.execute("UPDATE product_images SET status = 'failed' WHERE product_id = %s AND digest = %s", (product_id, digest))
+    conn.commit()
+
 def create_product(conn, product: ProductCreate) -> Optional[Product]:
     create_product_table(conn)
 
@@ -247,17 +867,46 @@ def create_product(conn, product: ProductCreate) -> Optional[Product]:
         RETURNING id, descricao, valor_venda, codigo_barras, secao, estoque_inicial, data_validade, imagens
     """)
     with conn.cursor() as cur:
-        cur.execute(query, (
-            product.descricao,
-            product.valor_venda,
-            product.codigo_barras,
-            product.secao,
-            product.estoque_inicial,
-            product.data_validade,
-            product.imagens
-        ))
+        try:
+            cur.execute(query, (
+                product.descricao,
+                product.valor_venda,
+                product.codigo_barras,
+                product.secao,
+                product.estoque_inicial,
+                product.data_validade,
+                product.imagens
+            ))
+        except psycopg2.errors.UniqueViolation:
+            conn.rollback()
+            raise ValueError("Código de barras já cadastrado!")
         row = cur.fetchone()
+        if row:
+            notify_product_changes(cur, [_product_row_event('create', row)])
         conn.commit()
+        if row:
+            product_data = {
+                'id': row[0],
+                'descricao': row[1],
+                'valor_venda': row[2],
+                'codigo_barras': row[3],
+                'secao': row[4],
+                'estoque_inicial': row[5],
+                'data_validade': row[6],
+                'imagens': row[7]
+            }
+            product = Product(**product_data)
+            barcode_index.put(product)
+            return product
+        return None
+
+def get_product_id(conn, product_id: int, fields=None) -> Optional[Product]:
+    if fields:
+        rows = select_fields(conn, 'products', fields, product_id)
+        return rows[0] if rows else None
+    with conn.cursor() as cur:
+        execute_statement(cur, "get_product_id", (product_id,))
+        row = cur.fetchone()
         if row:
             product_data = {
                 'id': row[0],
@@ -272,10 +921,9 @@ def create_product(conn, product: ProductCreate) -> Optional[Product]:
             return Product(**product_data)
         return None
 
-def get_product_id(conn, product_id: int) -> Optional[Product]:
-    query = sql.SQL("SELECT id, descricao, valor_venda, codigo_barras, secao, estoque_inicial, data_validade, imagens FROM products WHERE id = %s")
+def get_product_barcode(conn, codigo_barras: str) -> Optional[Product]:
     with conn.cursor() as cur:
-        cur.execute(query, (product_id,))
+        execute_statement(cur, "get_product_barcode", (codigo_barras,))
         row = cur.fetchone()
         if row:
             product_data = {
@@ -291,7 +939,9 @@ def get_product_id(conn, product_id: int) -> Optional[Product]:
             return Product(**product_data)
         return None
 
-def get_all_products(conn) -> List[Product]:
+def get_all_products(conn, fields=None) -> List[Product]:
+    if fields:
+        return select_fields(conn, 'products', fields)
     query = sql.SQL("SELECT id, descricao, valor_venda, codigo_barras, secao, estoque_inicial, data_validade, imagens FROM products")
     with conn.cursor() as cur:
         cur.execute(query)
@@ -311,6 +961,42 @@ def get_all_products(conn) -> List[Product]:
             products.append(Product(**product_data))
         return products
 
+def search_products(conn, term: str, secao: Optional[str], limit: int, offset: int) -> List[Product]:
+    prefix = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    if _trigram_enabled:
+        match = sql.SQL("OR %(term)s <%% descricao")
+        rank = sql.SQL("+ word_similarity(%(term)s, descricao)")
+    else:
+        match = rank = sql.SQL("")
+    query = sql.SQL("""
+        SELECT id, descricao, valor_venda, codigo_barras, secao, estoque_inicial, data_validade, imagens
+        FROM (
+            SELECT p.*, ts_rank({vector}, q.tsq) {rank} AS rank
+            FROM products p, websearch_to_tsquery('portuguese', %(term)s) AS q(tsq)
+            WHERE ({vector} @@ q.tsq OR descricao ILIKE %(prefix)s {match})
+              AND (%(secao)s::varchar IS NULL OR secao = %(secao)s)
+        ) ranked
+        ORDER BY rank DESC, id
+        LIMIT %(limit)s OFFSET %(offset)s
+    """).format(vector=sql.SQL(PRODUCT_SEARCH_VECTOR), rank=rank, match=match)
+    with conn.cursor() as cur:
+        cur.execute(query, {'term': term, 'prefix': prefix, 'secao': secao, 'limit': limit, 'offset': offset})
+        rows = cur.fetchall()
+        products = []
+        for row in rows:
+            product_data = {
+                'id': row[0],
+                'descricao': row[1],
+                'valor_venda': row[2],
+                'codigo_barras': row[3],
+                'secao': row[4],
+                'estoque_inicial': row[5],
+                'data_validade': row[6],
+                'imagens': row[7]
+            }
+            products.append(Product(**product_data))
+        return products
+
 def update_product(conn, product_id: int, product_data: ProductCreate) -> Optional[Product]:
     query = sql.SQL("""
         UPDATE products
@@ -325,17 +1011,23 @@ def update_product(conn, product_id: int, product_data: ProductCreate) -> Option
         RETURNING id, descricao, valor_venda, codigo_barras, secao, estoque_inicial, data_validade, imagens
     """)
     with conn.cursor() as cur:
-        cur.execute(query, (
-            product_data.descricao,
-            product_data.valor_venda,
-            product_data.codigo_barras,
-            product_data.secao,
-            product_data.estoque_inicial,
-            product_data.data_validade,
-            product_data.imagens,
-            product_id
-        ))
+        try:
+            cur.execute(query, (
+                product_data.descricao,
+                product_data.valor_venda,
+                product_data.codigo_barras,
+                product_data.secao,
+                product_data.estoque_inicial,
+                product_data.data_validade,
+                product_data.imagens,
+                product_id
+            ))
+        except psycopg2.errors.UniqueViolation:
+            conn.rollback()
+            raise ValueError("Código de barras já cadastrado!")
         row = cur.fetchone()
+        if row:
+            notify_product_changes(cur, [_product_row_event('update', row)])
         conn.commit()
         if row:
             updated_product_data = {
@@ -348,170 +1040,1081 @@ def update_product(conn, product_id: int, product_data: ProductCreate) -> Option
                 'data_validade': row[6],
                 'imagens': row[7]
             }
-            return Product(**updated_product_data)
+            updated_product = Product(**updated_product_data)
+            barcode_index.put(updated_product)
+            return updated_product
         return None
 
+def get_products_ids(conn, product_ids: List[int]) -> List[Product]:
+    query = sql.SQL("SELECT id, descricao, valor_venda, codigo_barras, secao, estoque_inicial, data_validade, imagens FROM products WHERE id = ANY(%s)")
+    with conn.cursor() as cur:
+        cur.execute(query, (list(product_ids),))
+        rows = cur.fetchall()
+        products = {}
+        for row in rows:
+            product_data = {
+                'id': row[0],
+                'descricao': row[1],
+                'valor_venda': row[2],
+                'codigo_barras': row[3],
+                'secao': row[4],
+                'estoque_inicial': row[5],
+                'data_validade': row[6],
+                'imagens': row[7]
+            }
+            products[row[0]] = Product(**product_data)
+        # Mantém a ordem dos ids pedidos, sem repetições
+        return [products[product_id] for product_id in dict.fromkeys(product_ids) if product_id in products]
+
+_PRODUCT_PATCH_FIELDS = ('descricao', 'valor_venda', 'codigo_barras', 'secao', 'estoque_inicial', 'data_validade', 'imagens')
+
+def bulk_update_products(conn, patches: List[ProductPatch]) -> List[ProductBulkResult]:
+    # Atualizações repetidas para o mesmo id são combinadas; a última vence campo a campo
+    merged = {}
+    for patch in patches:
+        values = merged.setdefault(patch.id, dict.fromkeys(_PRODUCT_PATCH_FIELDS))
+        for field in _PRODUCT_PATCH_FIELDS:
+            value = getattr(patch, field)
+            if value is not None:
+                values[field] = value
+
+    query = """
+        UPDATE products p
+        SET descricao = COALESCE(v.descricao, p.descricao),
+            valor_venda = COALESCE(v.valor_venda, p.valor_venda),
+            codigo_barras = COALESCE(v.codigo_barras, p.codigo_barras),
+            secao = COALESCE(v.secao, p.secao),
+            estoque_inicial = COALESCE(v.estoque_inicial, p.estoque_inicial),
+            data_validade = COALESCE(v.data_validade, p.data_validade),
+            imagens = COALESCE(v.imagens, p.imagens)
+        FROM (VALUES %s) AS v(id, descricao, valor_venda, codigo_barras, secao, estoque_inicial, data_validade, imagens)
+        WHERE p.id = v.id
+        RETURNING p.id, p.descricao, p.valor_venda, p.codigo_barras, p.secao, p.estoque_inicial, p.data_validade, p.imagens
+    """
+    template = "(%s::integer, %s::text, %s::numeric, %s::varchar, %s::varchar, %s::integer, %s::date, %s::text[])"
+    values = [(product_id, *(fields[field] for field in _PRODUCT_PATCH_FIELDS)) for product_id, fields in merged.items()]
+    with conn.cursor() as cur:
+        try:
+            rows = execute_values(cur, query, values, template=template, page_size=len(values), fetch=True)
+        except psycopg2.errors.UniqueViolation:
+            conn.rollback()
+            raise ValueError("Código de barras já cadastrado!")
+        notify_product_changes(cur, [_product_row_event('update', row) for row in rows])
+        conn.commit()
+
+    updated = {}
+    for row in rows:
+        product_data = {
+            'id': row[0],
+            'descricao': row[1],
+            'valor_venda': row[2],
+            'codigo_barras': row[3],
+            'secao': row[4],
+            'estoque_inicial': row[5],
+            'data_validade': row[6],
+            'imagens': row[7]
+        }
+        product = Product(**product_data)
+        barcode_index.put(product)
+        updated[product.id] = product
+    return [
+        ProductBulkResult(id=product_id, updated=product_id in updated, product=updated.get(product_id))
+        for product_id in merged
+    ]
+
 def delete_product(conn, product_id: int) -> bool:
-    query = sql.SQL("DELETE FROM products WHERE id = %s RETURNING id")
+    query = sql.SQL("DELETE FROM products WHERE id = %s RETURNING id, secao, codigo_barras")
     with conn.cursor() as cur:
         cur.execute(query, (product_id,))
         row = cur.fetchone()
+        if row is not None:
+            notify_product_changes(cur, [product_event('delete', row[0], secao=row[1], codigo_barras=row[2])])
         conn.commit()
+        if row is not None:
+            barcode_index.remove(product_id)
         return row is not None
     
 ##### Pedidos #####
 
+##### Partições de pedidos #####
+
+# orders e order_items são particionadas por mês de created_at; as partições futuras são criadas com antecedência
+ORDER_PARTITIONS_AHEAD = int(os.getenv("ORDER_PARTITIONS_AHEAD", "3"))
+PARTITION_MAINTENANCE_INTERVAL = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "21600"))
+ORDER_TABLES = ('orders', 'order_items')
+ORDER_PARTITION_NAME = re.compile(r'^(orders|order_items)_(\d{4})_(\d{2})$')
+_ORDERS_SCHEMA_LOCK = 7240041  # pg_advisory_xact_lock: um worker por vez altera o esquema dos pedidos
+_orders_schema_ready = False
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+def add_months(month: date, count: int) -> date:
+    years, index = divmod(month.month - 1 + count, 12)
+    return date(month.year + years, index + 1, 1)
+
+def order_partition_name(table: str, month: date) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+def _create_partitioned_orders(cur, orders_id: sql.Composable, items_id: sql.Composable):
+    cur.execute(sql.SQL("""
+        CREATE TABLE orders (
+            id {orders_id},
+            client_id INTEGER NOT NULL REFERENCES clients(id),
+            total NUMERIC(10, 2) NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            document JSONB,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """).format(orders_id=orders_id))
+    # created_at repete o do pedido para que os itens caiam na partição do mesmo mês
+    cur.execute(sql.SQL("""
+        CREATE TABLE order_items (
+            id {items_id},
+            order_id INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            product_id INTEGER NOT NULL REFERENCES products(id),
+            quantity INTEGER NOT NULL,
+            unit_price NUMERIC(10, 2),
+            product JSONB,
+            PRIMARY KEY (id, created_at),
+            FOREIGN KEY (order_id, created_at) REFERENCES orders (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """).format(items_id=items_id))
+    cur.execute("CREATE INDEX order_items_order_id_idx ON order_items (order_id)")
+
+def create_order_partitions(cur, first_month: date, last_month: date):
+    month = month_start(first_month)
+    while month <= last_month:
+        for table in ORDER_TABLES:
+            cur.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)").format(
+                sql.Identifier(order_partition_name(table, month)), sql.Identifier(table),
+            ), (month, add_months(month, 1)))
+        month = add_months(month, 1)
+
+def _migrate_orders_to_partitions(cur):
+    # Tabelas antigas (heap único): renomeia, recria particionada e copia os dados na mesma transação
+    cur.execute("SELECT pg_get_serial_sequence('orders', 'id'), pg_get_serial_sequence('order_items', 'id')")
+    sequences = cur.fetchone()
+    cur.execute("SELECT min(created_at) FROM orders")
+    oldest = cur.fetchone()[0] or datetime.now()
+    cur.execute("""
+        ALTER TABLE order_items RENAME TO order_items_legacy;
+        ALTER TABLE orders RENAME TO orders_legacy;
+        ALTER INDEX IF EXISTS order_items_pkey RENAME TO order_items_legacy_pkey;
+        ALTER INDEX IF EXISTS orders_pkey RENAME TO orders_legacy_pkey;
+    """)
+    _create_partitioned_orders(cur, *(
+        sql.SQL("INTEGER NOT NULL DEFAULT nextval({}::regclass)").format(sql.Literal(sequence)) for sequence in sequences
+    ))
+    create_order_partitions(cur, oldest.date(), add_months(month_start(date.today()), ORDER_PARTITIONS_AHEAD))
+    cur.execute("""
+        INSERT INTO orders (id, client_id, total, created_at)
+        SELECT id, client_id, total, COALESCE(created_at, CURRENT_TIMESTAMP) FROM orders_legacy
+    """)
+    cur.execute("""
+        INSERT INTO order_items (id, order_id, created_at, product_id, quantity)
+        SELECT oi.id, oi.order_id, o.created_at, oi.product_id, oi.quantity
+        FROM order_items_legacy oi
+        JOIN orders o ON o.id = oi.order_id
+    """)
+    for table, sequence in zip(ORDER_TABLES, sequences):
+        cur.execute(sql.SQL("ALTER SEQUENCE {} OWNED BY {}.id").format(
+            sql.SQL(sequence), sql.Identifier(table),
+        ))
+    cur.execute("DROP TABLE order_items_legacy, orders_legacy")
+
+# Pedidos anteriores ao documento desnormalizado: o retrato do produto usa o preço atual, o único disponível
+_BACKFILL_ORDER_DOCUMENTS = """
+    UPDATE order_items oi
+    SET unit_price = p.valor_venda,
+        product = jsonb_build_object(
+            'id', p.id, 'descricao', p.descricao, 'valor_venda', p.valor_venda, 'codigo_barras', p.codigo_barras,
+            'secao', p.secao, 'estoque_inicial', p.estoque_inicial, 'data_validade', p.data_validade, 'imagens', p.imagens
+        )
+    FROM products p
+    WHERE p.id = oi.product_id AND oi.product IS NULL;
+
+    UPDATE orders o
+    SET document = jsonb_build_object(
+        'id', o.id, 'client_id', o.client_id, 'total', o.total, 'created_at', o.created_at::date,
+        'client', jsonb_build_object('id', c.id, 'nome', c.nome, 'email', c.email, 'cpf', c.cpf),
+        'items', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'id', oi.id, 'order_id', oi.order_id, 'product_id', oi.product_id, 'quantity', oi.quantity,
+                'unit_price', oi.unit_price, 'product', oi.product
+            ) ORDER BY oi.id)
+            FROM order_items oi
+            WHERE oi.order_id = o.id AND oi.created_at = o.created_at
+        ), '[]'::jsonb)
+    )
+    FROM clients c
+    WHERE c.id = o.client_id AND o.document IS NULL;
+"""
+
+def ensure_order_partitions(conn, ahead: int = ORDER_PARTITIONS_AHEAD):
+    current = month_start(date.today())
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (_ORDERS_SCHEMA_LOCK,))
+        create_order_partitions(cur, current, add_months(current, ahead))
+    conn.commit()
+
 def create_orders_table(conn):
+    # Executado uma vez por processo; a manutenção periódica cria as partições dos meses seguintes
+    global _orders_schema_ready
+    if _orders_schema_ready:
+        return
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (_ORDERS_SCHEMA_LOCK,))
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('orders')")
+        row = cur.fetchone()
+        if row is None:
+            _create_partitioned_orders(cur, sql.SQL("SERIAL"), sql.SQL("SERIAL"))
+        elif row[0] == 'r':
+            _migrate_orders_to_partitions(cur)
+            cur.execute(_BACKFILL_ORDER_DOCUMENTS)
+        else:
+            cur.execute("SELECT 1 FROM information_schema.columns WHERE table_name = 'orders' AND column_name = 'document'")
+            if cur.fetchone() is None:
+                cur.execute("""
+                    ALTER TABLE orders ADD COLUMN document JSONB;
+                    ALTER TABLE order_items ADD COLUMN unit_price NUMERIC(10, 2), ADD COLUMN product JSONB;
+                """)
+                cur.execute(_BACKFILL_ORDER_DOCUMENTS)
+    conn.commit()
+    ensure_order_partitions(conn)
+    _orders_schema_ready = True
+
+def list_order_partitions(conn) -> List[dict]:
+    # Partições mensais, anexadas ou já desanexadas (aguardando arquivamento)
     with conn.cursor() as cur:
         cur.execute("""
-            CREATE TABLE IF NOT EXISTS orders (
-                id SERIAL PRIMARY KEY,
-                client_id INTEGER NOT NULL REFERENCES clients(id),
-                total NUMERIC(10, 2) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS order_items (
-                id SERIAL PRIMARY KEY,
-                order_id INTEGER NOT NULL REFERENCES orders(id),
-                product_id INTEGER NOT NULL REFERENCES products(id),
-                quantity INTEGER NOT NULL
-            )
+            SELECT c.relname, c.relispartition, c.reltuples::bigint, pg_total_relation_size(c.oid)
+            FROM pg_class c
+            WHERE c.relkind = 'r' AND pg_table_is_visible(c.oid)
+              AND c.relname ~ '^(orders|order_items)_[0-9]{4}_[0-9]{2}$'
+            ORDER BY c.relname
         """)
-        conn.commit()
+        partitions = []
+        for name, attached, rows, size in cur.fetchall():
+            table, year, month = ORDER_PARTITION_NAME.match(name).groups()
+            partitions.append({
+                'name': name,
+                'table': table,
+                'month': date(int(year), int(month), 1),
+                'attached': attached,
+                'rows': max(rows, 0),
+                'size': size,
+            })
+    return partitions
 
-def update_product_stock(conn, product_id: int, quantity: int):
-    query = sql.SQL("""
-        UPDATE products
-        SET estoque_inicial = estoque_inicial - %s
-        WHERE id = %s AND estoque_inicial - %s >= 0
-        RETURNING id, estoque_inicial
-    """)
+def detach_order_partitions(conn, month: date) -> List[str]:
+    # Itens primeiro: a partição de pedidos só sai quando nenhum item a referencia
+    detached = []
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (_ORDERS_SCHEMA_LOCK,))
+        for table in reversed(ORDER_TABLES):
+            name = order_partition_name(table, month)
+            cur.execute("SELECT relispartition FROM pg_class WHERE oid = to_regclass(%s)", (name,))
+            row = cur.fetchone()
+            if row and row[0]:
+                cur.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(sql.Identifier(table), sql.Identifier(name)))
+                detached.append(name)
+            if row and table == 'order_items':
+                # A FK herdada continua apontando para orders, de onde os pedidos do mês saem logo em seguida
+                cur.execute("""
+                    SELECT conname FROM pg_constraint
+                    WHERE conrelid = to_regclass(%s) AND contype = 'f' AND confrelid = 'orders'::regclass
+                """, (name,))
+                for (constraint,) in cur.fetchall():
+                    cur.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}").format(sql.Identifier(name), sql.Identifier(constraint)))
+    conn.commit()
+    return detached
+
+def copy_order_partition(conn, name: str, output):
+    if not ORDER_PARTITION_NAME.match(name):
+        raise ValueError(f"Partição inválida: {name}")
     with conn.cursor() as cur:
-        cur.execute(query, (quantity, product_id, quantity))
+        cur.copy_expert(sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER)").format(sql.Identifier(name)).as_string(conn), output)
+
+def drop_order_partition(conn, name: str):
+    if not ORDER_PARTITION_NAME.match(name):
+        raise ValueError(f"Partição inválida: {name}")
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+    conn.commit()
+
+def maintain_order_partitions():
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        ensure_order_partitions(conn)
+    finally:
+        _release(pool, conn)
+
+def update_product_stock(conn, product_id: int, quantity: int, commit: bool = True):
+    with conn.cursor() as cur:
+        execute_statement(cur, "update_product_stock", (quantity, product_id))
         row = cur.fetchone()
-        conn.commit()
+        if row:
+            notify_product_changes(cur, [product_event('stock', row[0], secao=row[2], estoque_inicial=row[1])])
+        if commit:
+            conn.commit()
         if not row:
             raise ValueError(f"Estoque insuficiente para o produto com ID {product_id}")
         updated_stock = row[1]
         if updated_stock < 0:
             raise ValueError(f"Estoque insuficiente para o produto com ID {product_id}")
+        if commit:
+            barcode_index.update_stock(product_id, updated_stock)
 
 
-def create_order(conn, order: OrderCreate) -> Optional[Order]:
+def create_order(conn, order: OrderCreate, commit: bool = True) -> Optional[Order]:
     create_orders_table(conn)
 
-    total = 0
-    order_items = []
     for item in order.items:
         product = get_product_id(conn, item.product_id)
         if not product:
             raise ValueError(f"Produto com ID {item.product_id} não encontrado")
         if product.estoque_inicial < item.quantity:
             raise ValueError(f"Estoque insuficiente para o produto com ID {item.product_id}")
-        total += product.valor_venda * item.quantity
 
-    query = sql.SQL("""
-        INSERT INTO orders (client_id, total, created_at)
-        VALUES (%s, %s, %s)
-        RETURNING id, client_id, total, created_at
-    """)
     created_at = datetime.now().date()
+    total = 0
+    sales = []
     with conn.cursor() as cur:
-        cur.execute(query, (order.client_id, total, created_at))
-        order_row = cur.fetchone()
-        if not order_row:
-            return None
-        order_id = order_row[0]
-
-        for item in order.items:
-            query = sql.SQL("""
-                INSERT INTO order_items (order_id, product_id, quantity)
-                VALUES (%s, %s, %s)
-                RETURNING id
-            """)
-            cur.execute(query, (order_id, item.product_id, item.quantity))
-            order_item_id = cur.fetchone()[0]
-            update_product_stock(conn, item.product_id, item.quantity)
-
-            product = get_product_id(conn, item.product_id)  # Obter o produto atualizado
-            order_item = OrderItem(
-                id=order_item_id,
+        order_id = _reserve_ids(cur, 'orders', 1)[0]
+        item_ids = _reserve_ids(cur, 'order_items', len(order.items))
+        order_items = []
+        for item_id, item in zip(item_ids, order.items):
+            update_product_stock(conn, item.product_id, item.quantity, commit=False)
+            # Produto relido com a linha já travada pela baixa de estoque: preço, total e retrato da venda coincidem
+            product = get_product_id(conn, item.product_id)
+            total += product.valor_venda * item.quantity
+            sales.append((product.id, product.secao, item.quantity, product.valor_venda * item.quantity))
+            order_items.append(OrderItem(
+                id=item_id,
                 order_id=order_id,
                 product=product,
+                unit_price=product.valor_venda,
                 **item.model_dump()  # Isso copia todos os campos de item para OrderItem
-            )
-            order_items.append(order_item)
-
-        conn.commit()
+            ))
 
         client = get_client_id(conn, order.client_id)  # Obter o cliente
-        return Order(
-            id=order_row[0],
-            client_id=order_row[1],
-            total=order_row[2],
-            created_at=order_row[3],
+        if client is None:
+            raise ValueError(f"Cliente com ID {order.client_id} não encontrado")
+        db_order = Order(
+            id=order_id,
+            client_id=order.client_id,
+            total=round(total, 2),
+            created_at=created_at,
             items=order_items,
             client=client
         )
-        
-def get_all_orders(conn) -> List[Order]:
+        insert_orders(cur, [db_order])
+        record_sales(cur, created_at, [sales])
+        if commit:
+            conn.commit()
+
+    if commit:
+        # Sem commit aqui, quem confirma a transação é o chamador; o índice é atualizado pelo feed de produtos
+        for order_item in order_items:
+            barcode_index.put(order_item.product)
+    return db_order
+
+def insert_orders(cur, orders: List[Order]):
+    # Cada pedido guarda o próprio documento JSON e cada item o retrato do produto vendido
+    order_rows = [
+        (order.id, order.client_id, order.total, order.created_at, Json(order.model_dump(mode='json')))
+        for order in orders
+    ]
+    item_rows = [
+        (item.id, order.id, order.created_at, item.product_id, item.quantity, item.unit_price, Json(item.product.model_dump(mode='json')))
+        for order in orders for item in order.items
+    ]
+    execute_values(cur, "INSERT INTO orders (id, client_id, total, created_at, document) VALUES %s", order_rows, page_size=len(order_rows))
+    if item_rows:
+        execute_values(cur, """
+            INSERT INTO order_items (id, order_id, created_at, product_id, quantity, unit_price, product) VALUES %s
+        """, item_rows, page_size=len(item_rows))
+
+def _reserve_ids(cur, table: str, count: int) -> List[int]:
+    cur.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)", (table, count))
+    return [row[0] for row in cur.fetchall()]
+
+def _write_orders(cur, entries, products: dict, clients: dict, created_at: date):
+    # Baixa o estoque e grava os pedidos de entries [(índice, pedido)] em poucos comandos
+    order_ids = _reserve_ids(cur, 'orders', len(entries))
+    item_ids = iter(_reserve_ids(cur, 'order_items', sum(len(order.items) for _, order in entries)))
+
+    orders_sales = []
+    decrements = {}
+    for _, order in entries:
+        sales = []
+        for item in order.items:
+            product = products[item.product_id]
+            sales.append((product.id, product.secao, item.quantity, product.valor_venda * item.quantity))
+            decrements[item.product_id] = decrements.get(item.product_id, 0) + item.quantity
+        orders_sales.append(sales)
+
+    stock_rows = execute_values(cur, """
+        UPDATE products p
+        SET estoque_inicial = p.estoque_inicial - v.quantity
+        FROM (VALUES %s) AS v(id, quantity)
+        WHERE p.id = v.id
+        RETURNING p.id, p.estoque_inicial, p.secao
+    """, sorted(decrements.items()), page_size=len(decrements), fetch=True)
+    notify_product_changes(cur, [product_event('stock', row[0], secao=row[2], estoque_inicial=row[1]) for row in stock_rows])
+    sold = dict(products)
+    for product_id, estoque, secao in stock_rows:
+        sold[product_id] = products[product_id].model_copy(update={'estoque_inicial': estoque})
+
+    created_orders = []
+    for order_id, (_, order) in zip(order_ids, entries):
+        items = [
+            OrderItem(
+                id=next(item_ids),
+                order_id=order_id,
+                product_id=item.product_id,
+                quantity=item.quantity,
+                unit_price=sold[item.product_id].valor_venda,
+                product=sold[item.product_id],
+            )
+            for item in order.items
+        ]
+        created_orders.append(Order(
+            id=order_id,
+            client_id=order.client_id,
+            total=round(sum(item.unit_price * item.quantity for item in items), 2),
+            created_at=created_at,
+            items=items,
+            client=clients[order.client_id]
+        ))
+    insert_orders(cur, created_orders)
+    record_sales(cur, created_at, orders_sales)
+    return created_orders, stock_rows
+
+def create_orders_batch(conn, orders: List[OrderCreate]) -> List[OrderBatchResult]:
+    create_orders_table(conn)
+
+    product_ids = sorted({item.product_id for order in orders for item in order.items})
+    client_ids = sorted({order.client_id for order in orders})
+    with conn.cursor() as cur:
+        # Bloqueia os produtos envolvidos (em ordem de id) até o commit: o estoque validado não muda no meio do lote
+        cur.execute("""
+            SELECT id, descricao, valor_venda, codigo_barras, secao, estoque_inicial, data_validade, imagens
+            FROM products WHERE id = ANY(%s) ORDER BY id FOR UPDATE
+        """, (product_ids,))
+        products = {}
+        for row in cur.fetchall():
+            product_data = {
+                'id': row[0],
+                'descricao': row[1],
+                'valor_venda': row[2],
+                'codigo_barras': row[3],
+                'secao': row[4],
+                'estoque_inicial': row[5],
+                'data_validade': row[6],
+                'imagens': row[7]
+            }
+            products[row[0]] = Product(**product_data)
+        # FOR KEY SHARE: um cliente não pode ser excluído entre a validação e a gravação dos pedidos
+        cur.execute("SELECT id, nome, email, cpf FROM clients WHERE id = ANY(%s) ORDER BY id FOR KEY SHARE", (client_ids,))
+        clients = {}
+        for row in cur.fetchall():
+            client_data = {
+                'id': row[0],
+                'nome': row[1],
+                'email': row[2],
+                'cpf': row[3]
+            }
+            clients[row[0]] = Client(**client_data)
+
+        # Validação em memória, pedido a pedido, consumindo o estoque disponível na ordem do lote
+        available = {product_id: product.estoque_inicial for product_id, product in products.items()}
+        results = [None] * len(orders)
+        accepted = []
+        for index, order in enumerate(orders):
+            error = None
+            if order.client_id not in clients:
+                error = f"Cliente com ID {order.client_id} não encontrado"
+            elif not order.items:
+                error = "Pedido sem itens"
+            needed = {}
+            for item in order.items:
+                if error:
+                    break
+                if item.product_id not in products:
+                    error = f"Produto com ID {item.product_id} não encontrado"
+                elif item.quantity <= 0:
+                    error = f"Quantidade inválida para o produto com ID {item.product_id}"
+                needed[item.product_id] = needed.get(item.product_id, 0) + item.quantity
+            for product_id, quantity in needed.items():
+                if error:
+                    break
+                if available[product_id] < quantity:
+                    error = f"Estoque insuficiente para o produto com ID {product_id}"
+            if error:
+                results[index] = OrderBatchResult(index=index, created=False, error=error)
+                continue
+            for product_id, quantity in needed.items():
+                available[product_id] -= quantity
+            accepted.append((index, order))
+
+        if not accepted:
+            conn.rollback()
+            return results
+
+        created_at = datetime.now().date()
+        written = []
+        stock_rows = []
+        cur.execute("SAVEPOINT orders_batch")
+        try:
+            created_orders, stock_rows = _write_orders(cur, accepted, products, clients, created_at)
+            written = list(zip(accepted, created_orders))
+        except (psycopg2.IntegrityError, psycopg2.DataError):
+            # Um pedido com erro não derruba os outros: regrava um a um, cada pedido em seu savepoint
+            cur.execute("ROLLBACK TO SAVEPOINT orders_batch")
+            for entry in accepted:
+                cur.execute("SAVEPOINT batch_order")
+                try:
+                    created, rows = _write_orders(cur, [entry], products, clients, created_at)
+                except (psycopg2.IntegrityError, psycopg2.DataError) as exc:
+                    cur.execute("ROLLBACK TO SAVEPOINT batch_order")
+                    results[entry[0]] = OrderBatchResult(index=entry[0], created=False, error=f"Erro ao gravar o pedido: {exc.diag.message_primary or exc}")
+                    continue
+                cur.execute("RELEASE SAVEPOINT batch_order")
+                written.append((entry, created[0]))
+                stock_rows.extend(rows)
+                products.update({row[0]: products[row[0]].model_copy(update={'estoque_inicial': row[1]}) for row in rows})
+        conn.commit()
+
+    for product_id, estoque, secao in stock_rows:
+        barcode_index.update_stock(product_id, estoque)
+    for (index, _), order in written:
+        results[index] = OrderBatchResult(index=index, created=True, order=order)
+    return results
+
+def _order_filters(order_id: Optional[int] = None, created_from: Optional[date] = None, created_to: Optional[date] = None):
+    # Filtros em created_at permitem ao Postgres ler só as partições mensais do período
+    conditions = []
+    params = []
+    if order_id is not None:
+        conditions.append(sql.SQL("id = %s"))
+        params.append(order_id)
+    if created_from is not None:
+        conditions.append(sql.SQL("created_at >= %s"))
+        params.append(created_from)
+    if created_to is not None:
+        conditions.append(sql.SQL("created_at < %s::date + 1"))
+        params.append(created_to)
+    where = sql.SQL("WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL("")
+    return where, params
+
+def _fetch_orders(conn, order_id: Optional[int] = None, fields=None, product_fields=None,
+                  created_from: Optional[date] = None, created_to: Optional[date] = None) -> List[dict]:
+    where, params = _order_filters(order_id, created_from, created_to)
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("SELECT document FROM orders {where} ORDER BY id").format(where=where), params)
+        documents = [row[0] for row in cur.fetchall()]
+
+    return [_trim_order(document, fields, product_fields) for document in documents]
+
+def _trim_order(document: dict, fields=None, product_fields=None) -> dict:
+    if product_fields:
+        for item in document['items']:
+            item['product'] = {field: item['product'].get(field) for field in product_fields}
+    if fields:
+        document = {field: document[field] for field in fields}
+    return document
+
+def stream_orders(deadline: float, fields=None, product_fields=None, created_from: Optional[date] = None,
+                  created_to: Optional[date] = None, role: str = 'write') -> QueryStream:
+    where, params = _order_filters(created_from=created_from, created_to=created_to)
+    if not (fields or product_fields):
+        # Sem recorte, o documento sai do banco já como texto JSON
+        query = sql.SQL("SELECT document::text FROM orders {where} ORDER BY id").format(where=where)
+        return stream_json_array(deadline, query, params, role)
+    query = sql.SQL("SELECT document FROM orders {where} ORDER BY id").format(where=where)
+    return stream_json_array(deadline, query, params, role, lambda document: json.dumps(_trim_order(document, fields, product_fields)))
+
+def get_order_json(conn, order_id: int) -> Optional[str]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT document::text FROM orders WHERE id = %s", (order_id,))
+        row = cur.fetchone()
+    return row[0] if row else None
+
+def get_order_id(conn, order_id: int, fields=None, product_fields=None):
+    orders = _fetch_orders(conn, order_id, fields, product_fields)
+    if not orders:
+        return None
+    if fields or product_fields:
+        return orders[0]
+    return Order(**orders[0])
+
+def create_sales_tables(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('sales_by_product_day') IS NOT NULL")
+        existed = cur.fetchone()[0]
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS sales_by_product_day (
+                day DATE NOT NULL,
+                product_id INTEGER NOT NULL,
+                quantity BIGINT NOT NULL DEFAULT 0,
+                revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+                order_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, product_id)
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS sales_by_secao_day (
+                day DATE NOT NULL,
+                secao VARCHAR(255) NOT NULL,
+                quantity BIGINT NOT NULL DEFAULT 0,
+                revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+                order_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, secao)
+            )
+        """)
+        conn.commit()
+    if not existed:
+        # Primeira criação: popula os agregados a partir do histórico existente
+        rebuild_sales_aggregates(conn)
+
+def record_sales(cur, day: date, orders_sales: list):
+    # Atualiza os agregados na mesma transação dos pedidos.
+    # orders_sales tem uma lista por pedido: [(product_id, secao, quantidade, receita), ...]
+    by_product = {}
+    by_secao = {}
+    for sales in orders_sales:
+        for totals, keys in ((by_product, [sale[0] for sale in sales]), (by_secao, [sale[1] or '' for sale in sales])):
+            for key in set(keys):
+                quantity_sum, revenue_sum, order_count = totals.get(key, (0, 0, 0))
+                totals[key] = (quantity_sum, revenue_sum, order_count + 1)
+        for product_id, secao, quantity, revenue in sales:
+            quantity_sum, revenue_sum, order_count = by_product[product_id]
+            by_product[product_id] = (quantity_sum + quantity, revenue_sum + revenue, order_count)
+            quantity_sum, revenue_sum, order_count = by_secao[secao or '']
+            by_secao[secao or ''] = (quantity_sum + quantity, revenue_sum + revenue, order_count)
+    if not by_product:
+        return
+    execute_values(cur, """
+        INSERT INTO sales_by_product_day AS s (day, product_id, quantity, revenue, order_count)
+        VALUES %s
+        ON CONFLICT (day, product_id) DO UPDATE
+        SET quantity = s.quantity + EXCLUDED.quantity,
+            revenue = s.revenue + EXCLUDED.revenue,
+            order_count = s.order_count + EXCLUDED.order_count
+    """, [(day, product_id, *totals) for product_id, totals in sorted(by_product.items())])
+    execute_values(cur, """
+        INSERT INTO sales_by_secao_day AS s (day, secao, quantity, revenue, order_count)
+        VALUES %s
+        ON CONFLICT (day, secao) DO UPDATE
+        SET quantity = s.quantity + EXCLUDED.quantity,
+            revenue = s.revenue + EXCLUDED.revenue,
+            order_count = s.order_count + EXCLUDED.order_count
+    """, [(day, secao, *totals) for secao, totals in sorted(by_secao.items())])
+
+def rebuild_sales_aggregates(conn):
+    # Recalcula tudo a partir dos pedidos (a receita usa o valor de venda atual dos produtos)
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('orders') IS NOT NULL AND to_regclass('order_items') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return
+        cur.execute("TRUNCATE sales_by_product_day, sales_by_secao_day")
+        cur.execute("""
+            INSERT INTO sales_by_product_day (day, product_id, quantity, revenue, order_count)
+            SELECT o.created_at::date, oi.product_id, SUM(oi.quantity), SUM(oi.quantity * p.valor_venda), COUNT(DISTINCT o.id)
+            FROM orders o
+            JOIN order_items oi ON oi.order_id = o.id AND oi.created_at = o.created_at
+            JOIN products p ON p.id = oi.product_id
+            GROUP BY o.created_at::date, oi.product_id
+        """)
+        cur.execute("""
+            INSERT INTO sales_by_secao_day (day, secao, quantity, revenue, order_count)
+            SELECT o.created_at::date, COALESCE(p.secao, ''), SUM(oi.quantity), SUM(oi.quantity * p.valor_venda), COUNT(DISTINCT o.id)
+            FROM orders o
+            JOIN order_items oi ON oi.order_id = o.id AND oi.created_at = o.created_at
+            JOIN products p ON p.id = oi.product_id
+            GROUP BY o.created_at::date, COALESCE(p.secao, '')
+        """)
+        conn.commit()
+
+def get_sales_by_secao(conn, start: date, end: date) -> List[SecaoSales]:
     query = sql.SQL("""
-        SELECT o.id, o.client_id, o.total, o.created_at, c.nome, c.email, c.cpf
-        FROM orders o
-        JOIN clients c ON o.client_id = c.id
+        SELECT day, secao, quantity, revenue, order_count
+        FROM sales_by_secao_day
+        WHERE day BETWEEN %s AND %s
+        ORDER BY day, secao
     """)
     with conn.cursor() as cur:
-        cur.execute(query)
-        order_rows = cur.fetchall()
-        orders = []
-        for order_row in order_rows:
-            client_data = {
-                'id': order_row[1],
-                'nome': order_row[4],
-                'email': order_row[5],
-                'cpf': order_row[6]
+        cur.execute(query, (start, end))
+        rows = cur.fetchall()
+        sales = []
+        for row in rows:
+            sales_data = {
+                'day': row[0],
+                'secao': row[1],
+                'quantity': row[2],
+                'revenue': row[3],
+                'order_count': row[4]
             }
+            sales.append(SecaoSales(**sales_data))
+        return sales
+
+def get_top_products(conn, start: date, end: date, limit: int) -> List[ProductSales]:
+    query = sql.SQL("""
+        SELECT s.product_id, p.descricao, s.quantity, s.revenue, s.order_count
+        FROM (
+            SELECT product_id, SUM(quantity) AS quantity, SUM(revenue) AS revenue, SUM(order_count) AS order_count
+            FROM sales_by_product_day
+            WHERE day BETWEEN %s AND %s
+            GROUP BY product_id
+            ORDER BY SUM(revenue) DESC
+            LIMIT %s
+        ) s
+        LEFT JOIN products p ON p.id = s.product_id
+        ORDER BY s.revenue DESC
+    """)
+    with conn.cursor() as cur:
+        cur.execute(query, (start, end, limit))
+        rows = cur.fetchall()
+        sales = []
+        for row in rows:
+            sales_data = {
+                'product_id': row[0],
+                'descricao': row[1],
+                'quantity': row[2],
+                'revenue': row[3],
+                'order_count': row[4]
+            }
+            sales.append(ProductSales(**sales_data))
+        return sales
+
+##### Sincronização #####
+
+# Cada linha guarda o id da transação que a alterou por último (change_xid). As consultas de mudanças só
+# devolvem alterações abaixo do xmin do snapshot atual, ou seja, de transações já encerradas; assim nenhuma
+# linha com posição menor que o cursor pode aparecer depois de um commit tardio.
+_SYNC_TABLES = {
+    'products': "id, descricao, valor_venda, codigo_barras, secao, estoque_inicial, data_validade, imagens",
+    'clients': "id, nome, email, cpf",
+}
+
+def create_change_tracking(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS tombstones (
+                entity VARCHAR(32) NOT NULL,
+                entity_id INTEGER NOT NULL,
+                change_xid BIGINT NOT NULL,
+                deleted_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (entity, entity_id)
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS tombstones_change_idx ON tombstones (entity, change_xid, entity_id)")
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION track_change() RETURNS trigger AS $$
+            BEGIN
+                NEW.updated_at := now();
+                NEW.change_xid := txid_current();
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION track_delete() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO tombstones (entity, entity_id, change_xid)
+                VALUES (TG_ARGV[0], OLD.id, txid_current())
+                ON CONFLICT (entity, entity_id) DO UPDATE
+                SET change_xid = EXCLUDED.change_xid, deleted_at = now();
+                RETURN OLD;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        for table in _SYNC_TABLES:
+            # Só altera a tabela na primeira vez, evitando travas exclusivas a cada inicialização
+            cur.execute("SELECT 1 FROM pg_trigger WHERE tgname = %s", (f"{table}_track_change",))
+            if cur.fetchone() is None:
+                cur.execute(sql.SQL("""
+                    ALTER TABLE {table}
+                    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    ADD COLUMN IF NOT EXISTS change_xid BIGINT
+                """).format(table=sql.Identifier(table)))
+                cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {index} ON {table} (change_xid, id)").format(
+                    index=sql.Identifier(f"{table}_change_idx"), table=sql.Identifier(table)))
+                cur.execute(sql.SQL("""
+                    CREATE TRIGGER {change} BEFORE INSERT OR UPDATE ON {table}
+                    FOR EACH ROW EXECUTE FUNCTION track_change()
+                """).format(change=sql.Identifier(f"{table}_track_change"), table=sql.Identifier(table)))
+                cur.execute(sql.SQL("""
+                    CREATE TRIGGER {delete} AFTER DELETE ON {table}
+                    FOR EACH ROW EXECUTE FUNCTION track_delete({entity})
+                """).format(delete=sql.Identifier(f"{table}_track_delete"), table=sql.Identifier(table), entity=sql.Literal(table)))
+                # Linhas anteriores ao rastreamento entram no histórico pela própria trigger
+                cur.execute(sql.SQL("UPDATE {table} SET updated_at = updated_at WHERE change_xid IS NULL").format(table=sql.Identifier(table)))
+        conn.commit()
+
+def parse_change_cursor(cursor: Optional[str]) -> tuple:
+    if not cursor:
+        return (0, 0)
+    try:
+        change_xid, row_id = cursor.split('.')
+        return (int(change_xid), int(row_id))
+    except ValueError:
+        raise ValueError("Cursor inválido")
+
+def _get_changes(conn, table: str, cursor: Optional[str], limit: int):
+    after_xid, after_id = parse_change_cursor(cursor)
+    columns = sql.SQL(_SYNC_TABLES[table])
+    nulls = sql.SQL(', ').join([sql.SQL("NULL")] * len(_SYNC_TABLES[table].split(',')))
+    query = sql.SQL("""
+        WITH horizon AS (SELECT txid_snapshot_xmin(txid_current_snapshot()) AS xmin)
+        SELECT *
+        FROM (
+            (SELECT change_xid, id AS row_id, false AS deleted, {columns}
+             FROM {table}, horizon
+             WHERE (change_xid, id) > (%(xid)s, %(id)s) AND change_xid < horizon.xmin
+             ORDER BY change_xid, id
+             LIMIT %(limit)s)
+            UNION ALL
+            (SELECT change_xid, entity_id, true, {nulls}
+             FROM tombstones, horizon
+             WHERE entity = %(entity)s AND (change_xid, entity_id) > (%(xid)s, %(id)s) AND change_xid < horizon.xmin
+             ORDER BY change_xid, entity_id
+             LIMIT %(limit)s)
+        ) changes
+        ORDER BY change_xid, row_id
+        LIMIT %(limit)s
+    """).format(table=sql.Identifier(table), columns=columns, nulls=nulls)
+    with conn.cursor() as cur:
+        cur.execute(query, {'xid': after_xid, 'id': after_id, 'entity': table, 'limit': limit})
+        rows = cur.fetchall()
+    next_cursor = f"{rows[-1][0]}.{rows[-1][1]}" if rows else f"{after_xid}.{after_id}"
+    return rows, next_cursor, len(rows) == limit
+
+def get_product_changes(conn, cursor: Optional[str], limit: int) -> ProductChanges:
+    rows, next_cursor, has_more = _get_changes(conn, 'products', cursor, limit)
+    products = []
+    deleted = []
+    for row in rows:
+        if row[2]:
+            deleted.append(row[1])
+            continue
+        product_data = {
+            'id': row[3],
+            'descricao': row[4],
+            'valor_venda': row[5],
+            'codigo_barras': row[6],
+            'secao': row[7],
+            'estoque_inicial': row[8],
+            'data_validade': row[9],
+            'imagens': row[10]
+        }
+        products.append(Product(**product_data))
+    return ProductChanges(items=products, deleted=deleted, cursor=next_cursor, has_more=has_more)
+
+def get_client_changes(conn, cursor: Optional[str], limit: int) -> ClientChanges:
+    rows, next_cursor, has_more = _get_changes(conn, 'clients', cursor, limit)
+    clients = []
+    deleted = []
+    for row in rows:
+        if row[2]:
+            deleted.append(row[1])
+            continue
+        client_data = {
+            'id': row[3],
+            'nome': row[4],
+            'email': row[5],
+            'cpf': row[6]
+        }
+        clients.append(Client(**client_data))
+    return ClientChanges(items=clients, deleted=deleted, cursor=next_cursor, has_more=has_more)
+
+##### Jobs em segundo plano #####
+
+# A própria tabela serve de fila: os workers disputam os jobs com FOR UPDATE SKIP LOCKED, sem broker externo
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "600"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+_JOBS_CLAIM_LOCK = 7240044
+JOB_COLUMNS = "id, kind, status, progress, params, error, result_path, created_by, created_at, started_at, finished_at"
+
+def create_jobs_table(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id BIGSERIAL PRIMARY KEY,
+                kind VARCHAR(50) NOT NULL,
+                params JSONB NOT NULL DEFAULT '{}',
+                status VARCHAR(10) NOT NULL DEFAULT 'queued',
+                progress REAL NOT NULL DEFAULT 0,
+                error TEXT,
+                result_path TEXT,
+                result_type VARCHAR(100),
+                created_by VARCHAR(100),
+                worker VARCHAR(100),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                started_at TIMESTAMPTZ,
+                heartbeat_at TIMESTAMPTZ,
+                finished_at TIMESTAMPTZ
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS jobs_pending_idx ON jobs (status, id) WHERE status IN ('queued', 'running')")
+        conn.commit()
+
+def _job_row(row) -> dict:
+    return dict(zip(JOB_COLUMNS.split(', '), row))
+
+def create_job(conn, kind: str, params: dict, created_by: Optional[str]) -> dict:
+    with conn.cursor() as cur:
+        cur.execute(
+            f"INSERT INTO jobs (kind, params, created_by) VALUES (%s, %s, %s) RETURNING {JOB_COLUMNS}",
+            (kind, Json(params), created_by),
+        )
+        job = _job_row(cur.fetchone())
+    conn.commit()
+    return job
+
+def get_job(conn, job_id: int) -> Optional[dict]:
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT {JOB_COLUMNS}, result_type FROM jobs WHERE id = %s", (job_id,))
+        row = cur.fetchone()
+    if row is None:
+        return None
+    return {**_job_row(row[:-1]), 'result_type': row[-1]}
+
+def claim_job(conn, worker: str, max_running: int) -> Optional[dict]:
+    # Claims serializados por advisory lock para respeitar o limite global de jobs em execução
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (_JOBS_CLAIM_LOCK,))
+        # Jobs de workers que morreram (sem heartbeat) voltam para a fila ou falham de vez
+        cur.execute("""
+            UPDATE jobs
+            SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+                error = CASE WHEN attempts >= %s THEN 'Worker interrompido' END,
+                finished_at = CASE WHEN attempts >= %s THEN now() END
+            WHERE status = 'running' AND heartbeat_at < now() - make_interval(secs => %s)
+        """, (JOB_MAX_ATTEMPTS, JOB_MAX_ATTEMPTS, JOB_MAX_ATTEMPTS, JOB_STALE_SECONDS))
+        cur.execute("SELECT count(*) FROM jobs WHERE status = 'running'")
+        if cur.fetchone()[0] >= max_running:
+            conn.commit()
+            return None
+        cur.execute(f"""
+            UPDATE jobs
+            SET status = 'running', attempts = attempts + 1, worker = %s,
+                started_at = now(), heartbeat_at = now(), progress = 0
+            WHERE id = (
+                SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {JOB_COLUMNS}
+        """, (worker,))
+        row = cur.fetchone()
+    conn.commit()
+    return _job_row(row) if row else None
+
+def update_job_progress(conn, job_id: int, progress: float):
+    with conn.cursor() as cur:
+        cur.execute(
+            "UPDATE jobs SET progress = %s, heartbeat_at = now() WHERE id = %s AND status = 'running'",
+            (min(max(progress, 0.0), 1.0), job_id),
+        )
+    conn.commit()
+
+def finish_job(conn, job_id: int, result_path: str, result_type: str):
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE jobs
+            SET status = 'done', progress = 1, result_path = %s, result_type = %s, finished_at = now()
+            WHERE id = %s
+        """, (result_path, result_type, job_id))
+    conn.commit()
+
+def fail_job(conn, job_id: int, error: str):
+    with conn.cursor() as cur:
+        cur.execute("UPDATE jobs SET status = 'failed', error = %s, finished_at = now() WHERE id = %s", (error, job_id))
+    conn.commit()
 
-            query_items = sql.SQL("""
-                SELECT oi.id, oi.order_id, oi.product_id, oi.quantity, p.descricao, p.valor_venda, p.codigo_barras, p.secao, p.estoque_inicial, p.data_validade, p.imagens
-                FROM order_items oi
-                JOIN products p ON oi.product_id = p.id
-                WHERE oi.order_id = %s
-            """)
-            cur.execute(query_items, (order_row[0],))
-            items_rows = cur.fetchall()
-
-            items = []
-            for row in items_rows:
-                product_data = {
-                    'id': row[2],
-                    'descricao': row[4],
-                    'valor_venda': row[5],
-                    'codigo_barras': row[6],
-                    'secao': row[7],
-                    'estoque_inicial': row[8],
-                    'data_validade': row[9],
-                    'imagens': row[10]
-                }
-                item_data = {
-                    'id': row[0],
-                    'order_id': row[1],
-                    'product_id': row[2],
-                    'quantity': row[3],
-                    'product': Product(**product_data)
-                }
-                items.append(OrderItem(**item_data))
-
-            order = Order(
-                id=order_row[0],
-                client_id=order_row[1],
-                total=order_row[2],
-                created_at=order_row[3],
-                client=Client(**client_data),
-                items=items
+def purge_jobs(conn, older_than_days: int) -> List[str]:
+    with conn.cursor() as cur:
+        cur.execute("""
+            DELETE FROM jobs
+            WHERE status IN ('done', 'failed') AND finished_at < now() - make_interval(days => %s)
+            RETURNING result_path
+        """, (older_than_days,))
+        paths = [row[0] for row in cur.fetchall() if row[0]]
+    conn.commit()
+    return paths
+
+##### Chaves de idempotência #####
+
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+# Quanto uma repetição espera pela requisição original ainda em andamento antes de receber 503
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", "10"))
+
+def create_idempotency_table(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                scope TEXT NOT NULL,
+                key VARCHAR(255) NOT NULL,
+                request_hash CHAR(64) NOT NULL,
+                status_code SMALLINT NOT NULL,
+                body JSONB NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                expires_at TIMESTAMPTZ NOT NULL,
+                PRIMARY KEY (scope, key)
             )
-            orders.append(order)
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idempotency_keys_expires_idx ON idempotency_keys (expires_at)")
+        conn.commit()
+
+def get_idempotent_response(conn, scope: str, key: str) -> Optional[tuple]:
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT request_hash, status_code, body FROM idempotency_keys
+            WHERE scope = %s AND key = %s AND expires_at > now()
+        """, (scope, key))
+        row = cur.fetchone()
+    conn.commit()
+    return row
+
+def lock_idempotency_key(conn, scope: str, key: str, wait: float = IDEMPOTENCY_WAIT):
+    # Trava de sessão: sobrevive aos commits da rota; repetições simultâneas esperam aqui pela original
+    with conn.cursor() as cur:
+        cur.execute("SELECT set_config('lock_timeout', %s, true)", (str(int(wait * 1000)),))
+        cur.execute("SELECT pg_advisory_lock(hashtextextended(%s, 0))", (f"{scope}\n{key}",))
+    conn.commit()
+
+def unlock_idempotency_key(conn, scope: str, key: str):
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_unlock(hashtextextended(%s, 0))", (f"{scope}\n{key}",))
+    conn.commit()
+
+def save_idempotent_response(conn, scope: str, key: str, request_hash: str, status_code: int, body, commit: bool = True):
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO idempotency_keys (scope, key, request_hash, status_code, body, expires_at)
+            VALUES (%s, %s, %s, %s, %s, now() + make_interval(secs => %s))
+            ON CONFLICT (scope, key) DO UPDATE
+            SET request_hash = EXCLUDED.request_hash, status_code = EXCLUDED.status_code, body = EXCLUDED.body,
+                created_at = now(), expires_at = EXCLUDED.expires_at
+        """, (scope, key, request_hash, status_code, Json(body), IDEMPOTENCY_TTL))
+    if commit:
+        conn.commit()
+
+def purge_idempotency_keys(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM idempotency_keys WHERE expires_at <= now()")
+        deleted = cur.rowcount
+    conn.commit()
+    return deleted
 
-        return orders
+def purge_expired_idempotency_keys() -> int:
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        return purge_idempotency_keys(conn)
+    finally:
+        _release(pool, conn)
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import os
+from typing import Iterable, Optional, Set
+
+import psycopg2
+import psycopg2.extensions
+
+from API import database
+from API.catalog import barcode_index
+from API.models import Product
+
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", "256"))
+
+# Evento enviado a um assinante lento cuja fila encheu: o cliente deve recarregar os dados
+RESYNC_EVENT = {'op': 'resync'}
+
+
+class Subscription:
+    def __init__(self, secoes: Optional[Iterable[str]] = None, product_ids: Optional[Iterable[int]] = None):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=FEED_QUEUE_SIZE)
+        self.secoes: Optional[Set[str]] = set(secoes) if secoes else None
+        self.product_ids: Optional[Set[int]] = set(product_ids) if product_ids else None
+        self.dropped = 0
+        self.resyncs = 0
+
+    def matches(self, event: dict) -> bool:
+        if self.secoes is None and self.product_ids is None:
+            return True
+        return (self.secoes is not None and event.get('secao') in self.secoes) or \
+            (self.product_ids is not None and event.get('id') in self.product_ids)
+
+    def push(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Contrapressão: descarta o que está pendente e pede ao cliente que ressincronize
+            self.dropped += self.queue.qsize()
+            self.resyncs += 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC_EVENT)
+
+
+class ChangeFeed:
+    # Um único LISTEN por worker, repassado a todos os assinantes WebSocket/SSE do processo
+    def __init__(self, channel: str = database.PRODUCT_CHANNEL):
+        self.channel = channel
+        self.subscriptions: Set[Subscription] = set()
+        self._conn = None
+        self._loop = None
+        self._task = None
+        self._dropped = 0
+        self._resyncs = 0
+
+    def subscribe(self, secoes=None, product_ids=None) -> Subscription:
+        subscription = Subscription(secoes, product_ids)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription in self.subscriptions:
+            self.subscriptions.discard(subscription)
+            self._dropped += subscription.dropped
+            self._resyncs += subscription.resyncs
+
+    def metrics(self) -> dict:
+        # dropped: eventos descartados por assinantes lentos (cada descarte gerou um resync)
+        return {
+            'subscribers': len(self.subscriptions),
+            'dropped': self._dropped + sum(subscription.dropped for subscription in self.subscriptions),
+            'resyncs': self._resyncs + sum(subscription.resyncs for subscription in self.subscriptions),
+        }
+
+    def publish(self, event: dict):
+        # Mantém o índice de códigos de barras coerente com as escritas feitas por outros workers
+        if event['op'] == 'stock':
+            barcode_index.update_stock(event['id'], event['estoque_inicial'])
+        elif event['op'] in ('create', 'update') and event.get('product'):
+            barcode_index.put(Product(**event['product']))
+        elif event['op'] in ('update', 'delete'):
+            barcode_index.remove(event['id'])
+        for subscription in list(self.subscriptions):
+            if event['op'] == 'resync' or subscription.matches(event):
+                subscription.push(event)
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._disconnect()
+
+    async def _run(self):
+        delay = 1
+        while True:
+            if self._conn is None:
+                try:
+                    await asyncio.to_thread(self._connect)
+                    delay = 1
+                except psycopg2.Error as exc:
+                    print(f'WARNING:  Falha ao escutar {self.channel} ({exc}); nova tentativa em {delay}s')
+                    delay = min(delay * 2, 30)
+            await asyncio.sleep(delay)
+
+    def _connect(self):
+        conn = database.get_connection()
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {self.channel}")
+        # Snapshot depois do LISTEN: o que mudou durante a queda (ou desde o warm_up) não chegou por NOTIFY
+        barcode_index.load(database.get_all_products(conn))
+        self._conn = conn
+        self._loop.call_soon_threadsafe(self._loop.add_reader, conn.fileno(), self._on_readable)
+        # Eventos podem ter sido perdidos enquanto não havia conexão
+        self._loop.call_soon_threadsafe(self.publish, RESYNC_EVENT)
+
+    def _disconnect(self):
+        if self._conn is None:
+            return
+        try:
+            self._loop.remove_reader(self._conn.fileno())
+        except (ValueError, psycopg2.InterfaceError):
+            pass
+        self._conn.close()
+        self._conn = None
+
+    def _on_readable(self):
+        try:
+            self._conn.poll()
+        except psycopg2.Error:
+            self._disconnect()
+            return
+        while self._conn.notifies:
+            notify = self._conn.notifies.pop(0)
+            try:
+                event = json.loads(notify.payload)
+            except ValueError:
+                continue
+            self.publish(event)
+
+
+product_feed = ChangeFeed()
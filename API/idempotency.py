@@ -0,0 +1,76 @@
+import hashlib
+import json
+from typing import Any, Callable, Optional
+
+import psycopg2
+from fastapi import HTTPException, Response, status
+from fastapi.encoders import jsonable_encoder
+
+from API import database
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def request_hash(body) -> str:
+    return hashlib.sha256(json.dumps(jsonable_encoder(body), sort_keys=True).encode()).hexdigest()
+
+
+def _replay(stored, expected_hash: str, response: Response):
+    stored_hash, status_code, body = stored
+    if stored_hash != expected_hash:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key já usada com outra requisição",
+        )
+    if status_code >= 400:
+        raise HTTPException(status_code=status_code, detail=body.get("detail"), headers={REPLAYED_HEADER: "true"})
+    # Devolve o corpo pela própria rota: o response_model e os cookies de get_db continuam valendo
+    response.status_code = status_code
+    response.headers[REPLAYED_HEADER] = "true"
+    return body
+
+
+def run_idempotent(conn, response: Response, scope: str, key: Optional[str], body, func: Callable[[bool], Any],
+                   status_code: int = status.HTTP_200_OK):
+    """Executa func uma única vez por (scope, key) e devolve a resposta guardada nas repetições.
+
+    func(commit) recebe commit=False quando há chave: a resposta é gravada na mesma transação da escrita,
+    então não existe pedido confirmado sem a chave correspondente. Respostas 2xx e 4xx ficam guardadas
+    por IDEMPOTENCY_TTL; erros 5xx não, para que a repetição tente de novo.
+    """
+    if key is None:
+        return func(True)
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Idempotency-Key inválida")
+
+    expected_hash = request_hash(body)
+    # Caminho rápido: repetição de uma requisição já concluída custa uma única consulta
+    stored = database.get_idempotent_response(conn, scope, key)
+    if stored is not None:
+        return _replay(stored, expected_hash, response)
+
+    database.lock_idempotency_key(conn, scope, key)
+    try:
+        # Quem esperou na trava encontra a resposta gravada pela requisição original
+        stored = database.get_idempotent_response(conn, scope, key)
+        if stored is not None:
+            return _replay(stored, expected_hash, response)
+        try:
+            result = func(False)
+        except HTTPException as exc:
+            if exc.status_code < 500:
+                conn.rollback()
+                database.save_idempotent_response(conn, scope, key, expected_hash, exc.status_code, {"detail": exc.detail})
+            raise
+        database.save_idempotent_response(conn, scope, key, expected_hash, status_code, jsonable_encoder(result), commit=False)
+        conn.commit()
+        response.status_code = status_code
+        return result
+    finally:
+        try:
+            conn.rollback()
+            database.unlock_idempotency_key(conn, scope, key)
+        except psycopg2.Error:
+            # Sem conseguir liberar a trava, a conexão é descartada pelo pool em vez de voltar travada
+            conn.close()
@@ -0,0 +1,237 @@
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, Dict, NamedTuple, Optional
+
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.responses import Response, StreamingResponse
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+IMAGE_DIR = Path(os.getenv("IMAGE_DIR", "/tmp/luconnect-images"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(40_000_000)))
+IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+# Formatos aceitos no upload -> extensão gravada em disco
+IMAGE_FORMATS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+MEDIA_TYPES = {"jpg": "image/jpeg", "png": "image/png", "webp": "image/webp", "gif": "image/gif"}
+
+
+def parse_image_sizes(value: str) -> Dict[str, int]:
+    # IMAGE_SIZES="thumb=200,medium=800": nome da variante -> lado maior em pixels
+    sizes = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, size = item.split("=", 1)
+            sizes[name.strip()] = int(size)
+    return sizes
+
+
+IMAGE_SIZES = parse_image_sizes(os.getenv("IMAGE_SIZES", "thumb=200,medium=800"))
+
+_ORIGINAL_NAME = re.compile(r"^([0-9a-f]{64})\.(jpg|png|webp|gif)$")
+_VARIANT_NAME = re.compile(r"^([\w-]+)\.(jpg|png|webp)$")
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class StoredImage(NamedTuple):
+    digest: str
+    extension: str
+    width: int
+    height: int
+
+
+##### Armazenamento #####
+
+def original_path(digest: str, extension: str) -> Path:
+    return IMAGE_DIR / "originals" / digest[:2] / f"{digest}.{extension}"
+
+
+def variant_path(digest: str, name: str) -> Path:
+    return IMAGE_DIR / "variants" / digest[:2] / digest / name
+
+
+def original_url(digest: str, extension: str) -> str:
+    return f"/images/{digest}.{extension}"
+
+
+def variant_url(digest: str, name: str) -> str:
+    return f"/images/{digest}/{name}"
+
+
+def _atomic_target(target: Path):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    return tempfile.NamedTemporaryFile(dir=target.parent, prefix=".partial-", delete=False)
+
+
+def store_original(source: BinaryIO) -> StoredImage:
+    # Grava o upload em disco calculando o SHA-256; o nome final é o próprio hash (deduplica reenvios)
+    # Pillow só é importado quando há imagem a tratar, fora do caminho de inicialização da API
+    from PIL import Image, UnidentifiedImageError
+
+    digest = hashlib.sha256()
+    size = 0
+    staging = IMAGE_DIR / "originals"
+    staging.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=staging, prefix=".partial-", delete=False) as tmp:
+        try:
+            while chunk := source.read(IMAGE_CHUNK_SIZE):
+                size += len(chunk)
+                if size > IMAGE_MAX_BYTES:
+                    raise ImageTooLarge(f"Imagem maior que {IMAGE_MAX_BYTES} bytes")
+                digest.update(chunk)
+                tmp.write(chunk)
+            tmp.flush()
+            # Só lê o cabeçalho: a decodificação completa fica para o worker
+            with Image.open(tmp.name) as image:
+                extension = IMAGE_FORMATS.get(image.format)
+                width, height = image.size
+            if extension is None:
+                raise ValueError("Formato de imagem não suportado")
+            if width * height > IMAGE_MAX_PIXELS:
+                raise ImageTooLarge(f"Imagem com mais de {IMAGE_MAX_PIXELS} pixels")
+        except (UnidentifiedImageError, Image.DecompressionBombError) as exc:
+            os.unlink(tmp.name)
+            raise ValueError("Arquivo não é uma imagem válida") from exc
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+    stored = StoredImage(digest.hexdigest(), extension, width, height)
+    target = original_path(stored.digest, extension)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(tmp.name, target)
+    return stored
+
+
+def _save(image: "Image.Image", target: Path, fmt: str):
+    with _atomic_target(target) as tmp:
+        if fmt == "WEBP":
+            image.save(tmp, "WEBP", quality=IMAGE_WEBP_QUALITY, method=4)
+        elif fmt == "JPEG":
+            image.convert("RGB").save(tmp, "JPEG", quality=85, optimize=True, progressive=True)
+        else:
+            image.save(tmp, "PNG", optimize=True)
+    os.replace(tmp.name, target)
+
+
+def generate_variants(digest: str, extension: str) -> Dict[str, str]:
+    # Miniaturas em WebP e no formato de fallback (JPEG, ou PNG quando há transparência), mais o original em WebP
+    from PIL import Image, ImageOps
+
+    variants = {}
+    with Image.open(original_path(digest, extension)) as source:
+        source.seek(0)
+        image = ImageOps.exif_transpose(source)
+        transparent = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if transparent else "RGB")
+        fallback, fallback_ext = ("PNG", "png") if transparent else ("JPEG", "jpg")
+        renditions = {"full": image}
+        for name, size in IMAGE_SIZES.items():
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+            renditions[name] = resized
+        for name, rendition in renditions.items():
+            formats = [("WEBP", "webp")] if name == "full" else [("WEBP", "webp"), (fallback, fallback_ext)]
+            for fmt, ext in formats:
+                filename = f"{name}.{ext}"
+                target = variant_path(digest, filename)
+                # Conteúdo endereçado pelo hash: variante já gerada não muda
+                if not target.is_file():
+                    _save(rendition, target, fmt)
+                variants[filename] = variant_url(digest, filename)
+    return variants
+
+
+##### Entrega #####
+
+def _parse_range(header: Optional[str], size: int):
+    # Apenas um intervalo; múltiplos intervalos recebem o arquivo inteiro, como a RFC 9110 permite
+    match = _RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    start, end = match.groups()
+    if start:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    elif end:
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        return None
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Intervalo inválido",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+def _read_file(path: Path, start: int, length: int):
+    with open(path, "rb") as source:
+        source.seek(start)
+        while length > 0:
+            chunk = source.read(min(IMAGE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def image_response(request: Request, path: Path, etag: str) -> Response:
+    if not path.is_file():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Imagem não encontrada")
+    headers = {
+        "Cache-Control": IMAGE_CACHE_CONTROL,
+        "ETag": f'"{etag}"',
+        "Accept-Ranges": "bytes",
+    }
+    media_type = MEDIA_TYPES[path.suffix[1:]]
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    size = path.stat().st_size
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range == headers["ETag"]:
+        byte_range = _parse_range(request.headers.get("range"), size)
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_read_file(path, 0, size), media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _read_file(path, start, end - start + 1),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=media_type,
+        headers=headers,
+    )
+
+
+# Públicas e sem banco: o nome é o hash do conteúdo, então o arquivo nunca muda e pode ficar em cache (CDN/navegador)
+router = APIRouter(prefix="/images")
+
+
+@router.get("/{name}")
+def get_original(request: Request, name: str):
+    match = _ORIGINAL_NAME.match(name)
+    if match is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Imagem não encontrada")
+    digest, extension = match.groups()
+    return image_response(request, original_path(digest, extension), digest)
+
+
+@router.get("/{digest}/{name}")
+def get_variant(request: Request, digest: str, name: str):
+    if not _DIGEST.match(digest) or not _VARIANT_NAME.match(name):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Imagem não encontrada")
+    return image_response(request, variant_path(digest, name), f"{digest}-{name}")
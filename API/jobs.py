@@ -0,0 +1,267 @@
+import csv
+import json
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable, Dict, NamedTuple, Type
+
+import psycopg2
+import psycopg2.errors
+from psycopg2 import sql
+from pydantic import BaseModel
+
+from API import database, images
+from API.models import ExportPeriodParams, ProductExportParams, ProductImageParams, SalesReportParams
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Limite global (todos os processos) de jobs rodando ao mesmo tempo
+JOB_MAX_RUNNING = int(os.getenv("JOB_MAX_RUNNING", "2"))
+JOBS_IN_PROCESS = os.getenv("JOBS_IN_PROCESS", "true").lower() in ("1", "true", "yes")
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+JOB_STATEMENT_TIMEOUT = int(os.getenv("JOB_STATEMENT_TIMEOUT", "300"))
+JOB_RESULT_DIR = Path(os.getenv("JOB_RESULT_DIR", "/tmp/luconnect-jobs"))
+JOB_RESULT_TTL_DAYS = int(os.getenv("JOB_RESULT_TTL_DAYS", "7"))
+
+
+class JobKind(NamedTuple):
+    params: Type[BaseModel]
+    handler: Callable
+
+
+JOB_KINDS: Dict[str, JobKind] = {}
+
+
+def job_kind(name: str, params: Type[BaseModel]):
+    def register(handler):
+        JOB_KINDS[name] = JobKind(params, handler)
+        return handler
+    return register
+
+
+class Progress:
+    # Grava o progresso no máximo uma vez por segundo; cada gravação também serve de heartbeat
+    def __init__(self, conn, job_id: int):
+        self.conn = conn
+        self.job_id = job_id
+        self._last = 0.0
+
+    def __call__(self, fraction: float):
+        now = time.monotonic()
+        if now - self._last >= 1:
+            self._last = now
+            database.update_job_progress(self.conn, self.job_id, fraction)
+
+
+def _result_path(job_id: int, suffix: str) -> Path:
+    JOB_RESULT_DIR.mkdir(parents=True, exist_ok=True)
+    return JOB_RESULT_DIR / f"job-{job_id}{suffix}"
+
+
+def _count(conn, query, params=None) -> int:
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        return cur.fetchone()[0]
+
+
+##### Tipos de job #####
+
+@job_kind("orders_export", ExportPeriodParams)
+def export_orders(conn, job_id: int, params: ExportPeriodParams, progress: Progress):
+    where, values = database._order_filters(created_from=params.created_from, created_to=params.created_to)
+    total = _count(conn, sql.SQL("SELECT count(*) FROM orders {where}").format(where=where), values) or 1
+    path = _result_path(job_id, ".csv")
+    done = 0
+    with open(path, "w", newline="") as output:
+        writer = csv.writer(output)
+        writer.writerow(["order_id", "created_at", "client_id", "client_nome", "total",
+                         "item_id", "product_id", "descricao", "quantity", "unit_price"])
+        query = sql.SQL("SELECT document FROM orders {where} ORDER BY id").format(where=where)
+        for rows in database.iter_batches(conn, query, values):
+            for (document,) in rows:
+                for item in document["items"]:
+                    writer.writerow([
+                        document["id"], document["created_at"], document["client_id"], document["client"]["nome"],
+                        document["total"], item["id"], item["product_id"], item["product"].get("descricao"),
+                        item["quantity"], item.get("unit_price"),
+                    ])
+            done += len(rows)
+            progress(done / total)
+    return path, "text/csv"
+
+
+@job_kind("products_export", ProductExportParams)
+def export_products(conn, job_id: int, params: ProductExportParams, progress: Progress):
+    where = sql.SQL("WHERE secao = %(secao)s" if params.secao else "")
+    values = {"secao": params.secao}
+    total = _count(conn, sql.SQL("SELECT count(*) FROM products {where}").format(where=where), values) or 1
+    path = _result_path(job_id, ".csv")
+    done = 0
+    with open(path, "w", newline="") as output:
+        writer = csv.writer(output)
+        writer.writerow(database.PRODUCT_FIELDS)
+        query = sql.SQL("SELECT {fields} FROM products {where} ORDER BY id").format(
+            fields=sql.SQL(", ").join(map(sql.Identifier, database.PRODUCT_FIELDS)), where=where,
+        )
+        for rows in database.iter_batches(conn, query, values):
+            writer.writerows(rows)
+            done += len(rows)
+            progress(done / total)
+    return path, "text/csv"
+
+
+@job_kind("sales_report", SalesReportParams)
+def sales_report(conn, job_id: int, params: SalesReportParams, progress: Progress):
+    end = params.end or date.today()
+    start = params.start or end - timedelta(days=30)
+    report = {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "secoes": [row.model_dump(mode="json") for row in database.get_sales_by_secao(conn, start, end)],
+    }
+    progress(0.5)
+    report["top_products"] = [row.model_dump(mode="json") for row in database.get_top_products(conn, start, end, params.limit)]
+    path = _result_path(job_id, ".json")
+    path.write_text(json.dumps(report))
+    return path, "application/json"
+
+
+@job_kind("product_images", ProductImageParams)
+def product_images(conn, job_id: int, params: ProductImageParams, progress: Progress):
+    try:
+        variants = images.generate_variants(params.digest, params.extension)
+    except Exception:
+        database.fail_product_image(conn, params.product_id, params.digest)
+        raise
+    progress(0.9)
+    url = images.original_url(params.digest, params.extension)
+    database.set_product_image_variants(conn, params.product_id, params.digest, url, variants)
+    path = _result_path(job_id, ".json")
+    path.write_text(json.dumps({"url": url, "variants": variants}))
+    return path, "application/json"
+
+
+##### Runner #####
+
+class JobRunner:
+    # Threads com conexões próprias, fora do pool das requisições: jobs pesados não disputam conexões com a API
+    def __init__(self, workers: int = JOB_WORKERS, max_running: int = JOB_MAX_RUNNING):
+        self.workers = workers
+        self.max_running = max_running
+        self._threads = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._last_purge = 0.0
+        self._purge_lock = threading.Lock()
+
+    def start(self):
+        self._stop.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        # Acorda os workers deste processo assim que um job é enfileirado
+        self._wake.set()
+
+    def _connect(self):
+        conn = database.get_connection()
+        with conn.cursor() as cur:
+            cur.execute("SELECT set_config('statement_timeout', %s, false)", (str(JOB_STATEMENT_TIMEOUT * 1000),))
+        conn.commit()
+        control = database.get_connection()
+        return conn, control
+
+    def _work(self):
+        name = f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+        conn = control = None
+        delay = 1
+        while not self._stop.is_set():
+            try:
+                if conn is None:
+                    conn, control = self._connect()
+                    delay = 1
+                self._purge(control)
+                job = database.claim_job(control, name, self.max_running)
+                if job is None:
+                    self._wake.wait(JOB_POLL_INTERVAL)
+                    self._wake.clear()
+                    continue
+                self._run(conn, control, job)
+            except psycopg2.Error as exc:
+                print(f"WARNING:  Worker de jobs sem banco ({exc}); nova tentativa em {delay}s")
+                for connection in (conn, control):
+                    if connection is not None:
+                        connection.close()
+                conn = control = None
+                self._stop.wait(delay)
+                delay = min(delay * 2, 30)
+        for connection in (conn, control):
+            if connection is not None:
+                connection.close()
+
+    def _run(self, conn, control, job: dict):
+        kind = JOB_KINDS.get(job["kind"])
+        try:
+            if kind is None:
+                raise ValueError(f"Tipo de job desconhecido: {job['kind']}")
+            path, media_type = kind.handler(conn, job["id"], kind.params(**job["params"]), Progress(control, job["id"]))
+            conn.rollback()
+            database.finish_job(control, job["id"], str(path), media_type)
+        except (psycopg2.errors.QueryCanceled, psycopg2.errors.LockNotAvailable) as exc:
+            # Subclasses de OperationalError, mas a conexão continua válida: o job falha em vez de voltar para a fila
+            conn.rollback()
+            database.fail_job(control, job["id"], f"Tempo limite excedido: {exc.diag.message_primary or exc}")
+        except psycopg2.OperationalError as exc:
+            if conn.closed:
+                raise  # Conexão perdida: o job volta para a fila quando o heartbeat expirar
+            conn.rollback()
+            database.fail_job(control, job["id"], str(exc))
+        except Exception as exc:
+            conn.rollback()
+            database.fail_job(control, job["id"], str(exc))
+
+    def _purge(self, control):
+        # Remove jobs encerrados há mais de JOB_RESULT_TTL_DAYS e os respectivos arquivos, uma vez por hora
+        if time.monotonic() - self._last_purge < 3600 or not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_purge = time.monotonic()
+            for path in database.purge_jobs(control, JOB_RESULT_TTL_DAYS):
+                Path(path).unlink(missing_ok=True)
+        finally:
+            self._purge_lock.release()
+
+
+job_runner = JobRunner()
+
+
+def main():
+    # Worker separado: python -m API.jobs (use JOBS_IN_PROCESS=false na API)
+    conn = database.get_connection()
+    try:
+        database.create_jobs_table(conn)
+    finally:
+        conn.close()
+    stopped = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stopped.set())
+    job_runner.start()
+    print(f"INFO:     Worker de jobs em execução ({job_runner.workers} threads)")
+    stopped.wait()
+    job_runner.stop()
+
+
+if __name__ == "__main__":
+    main()
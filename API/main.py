@@ -1,13 +1,125 @@
-from fastapi import FastAPI
-from API.routes import router
+import asyncio
+from contextlib import asynccontextmanager
+import psycopg2.errors
+from fastapi import Depends, FastAPI, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from jose import JWTError, jwt
+from jwt import PyJWTError
+from API.auth import ALGORITHM, SECRET_KEY
+from API.routes import oauth2_scheme, router
+from API import database, images, profiling
+from API.coalescing import read_flight
 
-app = FastAPI()
+async def warm_up(app: FastAPI):
+    # Repete o aquecimento até o banco responder; /readyz só fica pronto ao final
+    delay = 1
+    while True:
+        try:
+            await run_in_threadpool(database.warm_up)
+            app.state.ready = True
+            # Os workers de jobs só começam depois que o esquema (tabela jobs) existe
+            from API.jobs import JOBS_IN_PROCESS, job_runner
+            if JOBS_IN_PROCESS:
+                job_runner.start()
+            print('INFO:     Serviço em funcionamento [OK]')
+            return
+        except Exception as exc:
+            print(f'WARNING:  Falha no aquecimento ({exc}); nova tentativa em {delay}s')
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
 
-print('INFO:     Serviço em funcionamento [OK]')
+async def maintain_partitions():
+    # Garante as partições de pedidos dos próximos meses mesmo sem reinícios do serviço
+    while True:
+        await asyncio.sleep(database.PARTITION_MAINTENANCE_INTERVAL)
+        try:
+            await run_in_threadpool(database.maintain_order_partitions)
+        except Exception as exc:
+            print(f'WARNING:  Falha ao criar partições de pedidos ({exc})')
+
+async def purge_idempotency_keys():
+    # Remove as respostas guardadas cujo IDEMPOTENCY_TTL já venceu
+    while True:
+        await asyncio.sleep(3600)
+        try:
+            await run_in_threadpool(database.purge_expired_idempotency_keys)
+        except Exception as exc:
+            print(f'WARNING:  Falha ao remover chaves de idempotência ({exc})')
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Feed e jobs são importados aqui, e não no carregamento do módulo, para não pesar na inicialização
+    from API.feed import product_feed
+    from API.jobs import job_runner
+    warm_up_task = asyncio.create_task(warm_up(app))
+    maintenance_task = asyncio.create_task(maintain_partitions())
+    idempotency_task = asyncio.create_task(purge_idempotency_keys())
+    await product_feed.start()
+    yield
+    app.state.ready = False
+    warm_up_task.cancel()
+    maintenance_task.cancel()
+    idempotency_task.cancel()
+    await product_feed.stop()
+    # Jobs interrompidos voltam para a fila quando o heartbeat expirar
+    await asyncio.to_thread(job_runner.stop, 5)
+    # Encerramento gracioso: as requisições em andamento já foram drenadas pelo servidor
+    database.close_pool()
+
+app = FastAPI(lifespan=lifespan)
+app.state.ready = False
+
+##### Prazos das requisições #####
+
+@app.exception_handler(psycopg2.errors.QueryCanceled)
+async def query_canceled_handler(request: Request, exc: psycopg2.errors.QueryCanceled):
+    if getattr(request.state, 'client_disconnected', False):
+        # O cliente já foi embora; o status só aparece no log de acesso
+        return JSONResponse(status_code=499, content={"detail": "Requisição cancelada pelo cliente"})
+    return JSONResponse(status_code=504, content={"detail": "Tempo limite da requisição excedido"})
+
+@app.exception_handler(psycopg2.errors.LockNotAvailable)
+async def lock_timeout_handler(request: Request, exc: psycopg2.errors.LockNotAvailable):
+    return JSONResponse(status_code=503, content={"detail": "Recurso ocupado, tente novamente"}, headers={"Retry-After": "1"})
+
+@app.exception_handler(database.PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: database.PoolTimeout):
+    return JSONResponse(status_code=503, content={"detail": "Serviço sobrecarregado, tente novamente"}, headers={"Retry-After": "1"})
 
 @app.get("/")
 async def root():
     return {"message": "Bem-vindo Lu connect"}
 
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "aquecendo"})
+    return {"status": "pronto"}
+
+@app.get("/metrics")
+async def metrics(token: str = Depends(oauth2_scheme)):
+    # Expõe SQL, roteamento e estado interno: exige o mesmo token das demais rotas
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except (PyJWTError, JWTError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    from API.feed import product_feed
+    return {"statements": database.statement_metrics(), "coalescing": read_flight.metrics(), "routing": database.routing_metrics(), "feed": product_feed.metrics()}
+
 app.include_router(router)
+app.include_router(images.router)
 
+# Perfilamento por requisição: só é montado quando configurado, sem custo caso contrário
+if profiling.profiling_enabled():
+    app.add_middleware(profiling.ProfilingMiddleware)
+    app.include_router(profiling.router)
+    profiling.instrument_routes(app)
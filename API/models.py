@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, ConfigDict, Field, field_validator
-from typing import Optional, List
-from datetime import date
+from typing import Dict, Optional, List
+from datetime import date, datetime
 
 
 ##### Autenticação #####
@@ -53,6 +53,12 @@ class Client(ClientBase):
     
     model_config = ConfigDict(from_attributes=True)
     
+class ClientChanges(BaseModel):
+    items: List[Client]
+    deleted: List[int]
+    cursor: str
+    has_more: bool
+    
 ##### Produto #####
 
 class ProductBase(BaseModel):
@@ -81,6 +87,35 @@ class Product(ProductBase):
     id: int
     
     model_config = ConfigDict(from_attributes=True)
+
+class ProductImage(BaseModel):
+    digest: str
+    url: str
+    width: int
+    height: int
+    status: str
+    variants: Dict[str, str]
+    created_at: datetime
+
+class ProductChanges(BaseModel):
+    items: List[Product]
+    deleted: List[int]
+    cursor: str
+    has_more: bool
+
+class ProductBatchGet(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=1000)
+
+class ProductPatch(ProductUpdate):
+    id: int
+
+class ProductBulkUpdate(BaseModel):
+    items: List[ProductPatch] = Field(..., min_length=1, max_length=5000)
+
+class ProductBulkResult(BaseModel):
+    id: int
+    updated: bool
+    product: Optional[Product] = None
     
 ##### Pedidos ##### 
 
@@ -94,6 +129,7 @@ class OrderItemCreate(OrderItemBase):
 class OrderItem(OrderItemBase):
     id: int
     order_id: int
+    unit_price: Optional[float] = None
     product: Product
 
     model_config = ConfigDict(from_attributes=True)
@@ -112,4 +148,64 @@ class Order(OrderBase):
     client: Client
     items: List[OrderItem]
 
-    model_config = ConfigDict(from_attributes=True)      
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+class OrderBatchCreate(BaseModel):
+    orders: List[OrderCreate] = Field(..., min_length=1, max_length=500)
+
+class OrderBatchResult(BaseModel):
+    index: int
+    created: bool
+    order: Optional[Order] = None
+    error: Optional[str] = None
+
+##### Relatórios #####
+
+class SecaoSales(BaseModel):
+    day: date
+    secao: str
+    quantity: int
+    revenue: float
+    order_count: int
+
+class ProductSales(BaseModel):
+    product_id: int
+    descricao: Optional[str] = None
+    quantity: int
+    revenue: float
+    order_count: int
+
+##### Jobs #####
+
+class JobCreate(BaseModel):
+    kind: str
+    params: dict = {}
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    status: str
+    progress: float
+    params: dict
+    error: Optional[str] = None
+    result_url: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class ExportPeriodParams(BaseModel):
+    created_from: Optional[date] = None
+    created_to: Optional[date] = None
+
+class ProductExportParams(BaseModel):
+    secao: Optional[str] = None
+
+class ProductImageParams(BaseModel):
+    product_id: int
+    digest: str = Field(..., pattern=r"^[0-9a-f]{64}$")
+    extension: str
+
+class SalesReportParams(BaseModel):
+    start: Optional[date] = None
+    end: Optional[date] = None
+    limit: int = Field(100, ge=1, le=10000)
@@ -0,0 +1,93 @@
+import argparse
+import gzip
+import os
+import sys
+from datetime import date, datetime
+from pathlib import Path
+
+from API import database
+
+ARCHIVE_DIR = os.getenv("ORDER_ARCHIVE_DIR", "archive")
+
+
+def _parse_month(value: str) -> date:
+    try:
+        return datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Mês inválido: {value} (use AAAA-MM)")
+
+
+def _old_months(conn, before: date):
+    current = database.month_start(date.today())
+    if before > current:
+        raise SystemExit("Não é possível arquivar o mês corrente nem meses futuros")
+    return sorted({partition['month'] for partition in database.list_order_partitions(conn) if partition['month'] < before})
+
+
+def list_partitions(conn, args):
+    for partition in database.list_order_partitions(conn):
+        state = "anexada" if partition['attached'] else "desanexada"
+        print(f"{partition['name']:<24} {state:<11} ~{partition['rows']} linhas  {partition['size'] // 1024} KiB")
+
+
+def create_partitions(conn, args):
+    database.ensure_order_partitions(conn, args.ahead)
+    print(f"Partições garantidas até {database.add_months(database.month_start(date.today()), args.ahead):%Y-%m}")
+
+
+def detach_partitions(conn, args):
+    for month in _old_months(conn, args.before):
+        for name in database.detach_order_partitions(conn, month):
+            print(f"Desanexada: {name}")
+
+
+def archive_partitions(conn, args):
+    # Desanexa, grava cada partição em CSV compactado e só então remove a tabela
+    target = Path(args.dir)
+    target.mkdir(parents=True, exist_ok=True)
+    for month in _old_months(conn, args.before):
+        database.detach_order_partitions(conn, month)
+        for table in reversed(database.ORDER_TABLES):
+            name = database.order_partition_name(table, month)
+            path = target / f"{name}.csv.gz"
+            partial = path.with_name(path.name + ".partial")
+            with gzip.open(partial, "wb") as output:
+                database.copy_order_partition(conn, name, output)
+            conn.rollback()
+            partial.replace(path)
+            if not args.keep:
+                database.drop_order_partition(conn, name)
+            print(f"Arquivada: {name} -> {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m API.partitions", description="Partições mensais de orders/order_items")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="lista as partições").set_defaults(handler=list_partitions)
+
+    create = commands.add_parser("create", help="cria as partições do mês corrente e dos próximos meses")
+    create.add_argument("--ahead", type=int, default=database.ORDER_PARTITIONS_AHEAD)
+    create.set_defaults(handler=create_partitions)
+
+    detach = commands.add_parser("detach", help="desanexa as partições anteriores a um mês")
+    detach.add_argument("--before", type=_parse_month, required=True, help="AAAA-MM (exclusivo)")
+    detach.set_defaults(handler=detach_partitions)
+
+    archive = commands.add_parser("archive", help="desanexa, exporta para .csv.gz e remove as partições antigas")
+    archive.add_argument("--before", type=_parse_month, required=True, help="AAAA-MM (exclusivo)")
+    archive.add_argument("--dir", default=ARCHIVE_DIR)
+    archive.add_argument("--keep", action="store_true", help="mantém as tabelas desanexadas após exportar")
+    archive.set_defaults(handler=archive_partitions)
+
+    args = parser.parse_args(argv)
+    conn = database.get_connection()
+    try:
+        database.create_orders_table(conn)
+        args.handler(conn, args)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
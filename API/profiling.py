@@ -0,0 +1,188 @@
+import asyncio
+import contextvars
+import cProfile
+import functools
+import os
+import pstats
+import random
+import re
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+from fastapi import APIRouter, Header, HTTPException, status
+from fastapi.responses import FileResponse
+from fastapi.routing import APIRoute
+from starlette.routing import request_response
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "/tmp/luconnect-profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_HEADER = b"x-debug-token"
+
+_PROFILE_NAME = re.compile(r"^[\w.-]+\.pstats$")
+
+# Perfis coletados nas threads do threadpool durante a requisição perfilada
+_thread_profiles: contextvars.ContextVar = contextvars.ContextVar("thread_profiles", default=None)
+
+
+def profiling_enabled() -> bool:
+    return PROFILE_SAMPLE_RATE > 0 or bool(PROFILE_TOKEN)
+
+
+def _token_matches(token: Optional[str]) -> bool:
+    return bool(PROFILE_TOKEN) and token is not None and secrets.compare_digest(token, PROFILE_TOKEN)
+
+
+##### Armazenamento dos perfis #####
+
+class ProfileStore:
+    def __init__(self, directory: Path, max_files: int):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def save(self, stats: pstats.Stats, method: str, path: str, elapsed_ms: float) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        slug = re.sub(r"[^\w]+", "_", path).strip("_") or "root"
+        target = self.directory / f"{stamp}-{method}-{slug[:60]}-{int(elapsed_ms)}ms.pstats"
+        stats.dump_stats(str(target))
+        self._trim()
+        return target
+
+    def _trim(self):
+        # Buffer circular: mantém apenas os perfis mais recentes em disco
+        with self._lock:
+            files = self.list()
+            for old in files[self.max_files:]:
+                old.unlink(missing_ok=True)
+
+    def list(self) -> List[Path]:
+        if not self.directory.is_dir():
+            return []
+        files = [p for p in self.directory.iterdir() if _PROFILE_NAME.match(p.name)]
+        return sorted(files, key=lambda p: p.name, reverse=True)
+
+    def get(self, name: str) -> Optional[Path]:
+        if not _PROFILE_NAME.match(name):
+            return None
+        target = self.directory / name
+        return target if target.is_file() else None
+
+
+store = ProfileStore(PROFILE_DIR, PROFILE_MAX_FILES)
+
+
+##### Middleware #####
+
+class ProfilingMiddleware:
+    # Só as rotas síncronas são perfiladas, na thread do threadpool que executa a rota (instrument_routes).
+    # Um perfil na thread do event loop mediria também as outras requisições em andamento.
+    def __init__(self, app, sample_rate: float = PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+        # No Python 3.12+ o cProfile só admite um perfil ativo por vez no processo
+        self._busy = threading.Lock()
+
+    def _should_profile(self, scope) -> bool:
+        for name, value in scope.get("headers", []):
+            if name == PROFILE_HEADER:
+                return _token_matches(value.decode("latin-1"))
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        if not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        thread_profiles = []
+        context_token = _thread_profiles.set(thread_profiles)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _thread_profiles.reset(context_token)
+            self._busy.release()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if thread_profiles:
+                try:
+                    # Escrita em disco fora do event loop; uma falha ao gravar não afeta a resposta
+                    await asyncio.to_thread(_save_profile, thread_profiles, scope["method"], scope["path"], elapsed_ms)
+                except Exception as exc:
+                    print(f"WARNING:  Falha ao gravar o perfil de {scope['method']} {scope['path']} ({exc})")
+
+
+def _save_profile(thread_profiles: List[cProfile.Profile], method: str, path: str, elapsed_ms: float) -> Path:
+    stats = pstats.Stats(thread_profiles[0])
+    for thread_profile in thread_profiles[1:]:
+        stats.add(thread_profile)
+    return store.save(stats, method, path, elapsed_ms)
+
+
+def _profile_in_thread(func):
+    # Perfila apenas a chamada da rota, na thread do threadpool onde ela roda
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        thread_profiles = _thread_profiles.get()
+        if thread_profiles is None:
+            return func(*args, **kwargs)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+: outro perfil já está ativo no processo
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            thread_profiles.append(profiler)
+    return wrapper
+
+
+def instrument_routes(app):
+    for route in app.routes:
+        if isinstance(route, APIRoute) and not asyncio.iscoroutinefunction(route.dependant.call):
+            route.dependant.call = _profile_in_thread(route.dependant.call)
+            route.app = request_response(route.get_route_handler())
+
+
+##### Rotas de administração #####
+
+router = APIRouter(prefix="/admin/profiles")
+
+
+def _require_debug_token(x_debug_token: Optional[str]):
+    if not _token_matches(x_debug_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Token de depuração inválido")
+
+
+@router.get("")
+async def list_profiles(x_debug_token: Optional[str] = Header(None)):
+    _require_debug_token(x_debug_token)
+    profiles = []
+    for path in store.list():
+        info = path.stat()
+        profiles.append({
+            "name": path.name,
+            "size": info.st_size,
+            "created_at": datetime.fromtimestamp(info.st_mtime, timezone.utc).isoformat(),
+        })
+    return profiles
+
+
+@router.get("/{name}")
+async def download_profile(name: str, x_debug_token: Optional[str] = Header(None)):
+    _require_debug_token(x_debug_token)
+    path = store.get(name)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Perfil não encontrado")
+    return FileResponse(path, media_type="application/octet-stream", filename=path.name)
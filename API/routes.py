@@ -1,29 +1,73 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import json
+from typing import List, Optional
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Request, UploadFile, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from datetime import timedelta
-from jose import jwt
+from datetime import date, timedelta
+from pathlib import Path
+from pydantic import ValidationError
+from jose import JWTError, jwt
 from jwt import PyJWTError
-from API.database import create_order, create_user, get_all_orders, get_all_products
-from API import database
+from API.database import create_order, create_user
+from API import database, images
+from API.catalog import barcode_index
+from API.coalescing import read_flight
+from API.idempotency import run_idempotent
 from API.auth import ACCESS_TOKEN_EXPIRE_MINUTES, ALGORITHM, SECRET_KEY, authenticate_user_and_generate_token, create_access_token
-from API.models import Client, ClientCreate, ClientUpdate, Order, OrderCreate, Product, ProductCreate, ProductUpdate, Token, TokenRefresh, User, UserCreate
+from API.models import Client, ClientChanges, ClientCreate, ClientUpdate, Job, JobCreate, Order, OrderBatchCreate, OrderBatchResult, OrderCreate, Product, ProductBatchGet, ProductBulkResult, ProductBulkUpdate, ProductChanges, ProductCreate, ProductImage, ProductSales, ProductUpdate, SecaoSales, Token, TokenRefresh, User, UserCreate
 
 router = APIRouter()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+def parse_fields(fields: Optional[str], allowed) -> Optional[tuple]:
+    # fields=id,descricao,... restringe as colunas lidas e os campos devolvidos
+    if not fields:
+        return None
+    requested = tuple(dict.fromkeys(field.strip() for field in fields.split(',') if field.strip()))
+    invalid = [field for field in requested if field not in allowed]
+    if invalid or not requested:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Campos inválidos: {', '.join(invalid)}")
+    return requested
+
+def sparse_response(data):
+    return JSONResponse(content=jsonable_encoder(data))
+
+class QueryStreamResponse(StreamingResponse):
+    # Listagens: o array JSON é enviado lote a lote, lido de um cursor no servidor com conexão própria
+    def __init__(self, stream: database.QueryStream):
+        super().__init__(stream, media_type="application/json")
+        self.stream = stream
+
+    async def listen_for_disconnect(self, receive):
+        await super().listen_for_disconnect(receive)
+        # Cliente foi embora no meio do envio: cancela o FETCH em andamento
+        await run_in_threadpool(self.stream.cancel)
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Envio interrompido (desconexão ou erro): a conexão volta ao pool sem esperar o coletor de lixo
+            await run_in_threadpool(self.stream.close)
+
+def stream_response(stream: database.QueryStream):
+    return QueryStreamResponse(stream)
+
 ##### Rotas de autenticação #####
 
 @router.post("/auth/register", response_model=User)
-async def register_new_user(user: UserCreate, conn = Depends(database.get_connection)):
+def register_new_user(user: UserCreate, conn = Depends(database.get_db)):
     try:
         return create_user(conn, user)
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
 
 @router.post("/auth/login", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), conn = Depends(database.get_connection)):
+def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), conn = Depends(database.get_db)):
     token = authenticate_user_and_generate_token(conn, form_data.username, form_data.password)
     if not token:
         raise HTTPException(
@@ -46,19 +90,22 @@ async def refresh_token(token_refresh: TokenRefresh):
 ##### Rotas de clientes #####
 
 @router.post("/clients", response_model=Client)
-async def create_client(client: ClientCreate, conn = Depends(database.get_connection), token: str = Depends(oauth2_scheme)):
+def create_client(client: ClientCreate, response: Response, idempotency_key: Optional[str] = Header(None), conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        
-        new_client = database.create_client(conn, client)
-        if new_client:
-            return new_client
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Não foi possível criar o cliente",
-            )
-    except PyJWTError:
+
+        def create(commit: bool):
+            new_client = database.create_client(conn, client, commit=commit)
+            if new_client:
+                return new_client
+            else:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Não foi possível criar o cliente",
+                )
+
+        return run_idempotent(conn, response, f"POST /clients {payload.get('sub')}", idempotency_key, client, create)
+    except (PyJWTError, JWTError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido ou expirado",
@@ -66,54 +113,61 @@ async def create_client(client: ClientCreate, conn = Depends(database.get_connec
         )
         
 @router.get("/clients", response_model=List[Client])
-async def all_client(conn = Depends(database.get_connection), token: str = Depends(oauth2_scheme)):
+def all_client(request: Request, fields: Optional[str] = None, token: str = Depends(oauth2_scheme)):
+    selected = parse_fields(fields, database.CLIENT_FIELDS)
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         
-        clients = database.get_all_clients(conn)
-        return clients
+        return stream_response(database.stream_table(
+            database.route_deadline(request), 'clients', selected or database.CLIENT_FIELDS, database.connection_role(request),
+        ))
 
-    except PyJWTError:
+    except (PyJWTError, JWTError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido ou expirado",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    except:
+        
+@router.get("/clients/changes", response_model=ClientChanges)
+def client_changes(since: Optional[str] = None, limit: int = Query(500, ge=1, le=5000), conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+        return database.get_client_changes(conn, since, limit)
+
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except (PyJWTError, JWTError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token inválido",
+            detail="Token inválido ou expirado",
             headers={"WWW-Authenticate": "Bearer"},
         )
-        
+
 @router.get("/clients/{client_id}", response_model=Client)
-async def get_client_by_id(client_id: int, conn = Depends(database.get_connection), token: str = Depends(oauth2_scheme)):
+def get_client_by_id(client_id: int, fields: Optional[str] = None, conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
+    selected = parse_fields(fields, database.CLIENT_FIELDS)
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         
-        client = database.get_client_id(conn, client_id)
+        client = database.get_client_id(conn, client_id, selected)
         if client is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Cliente não encontrado",
             )
-        return client
+        return sparse_response(client) if selected else client
 
-    except PyJWTError:
+    except (PyJWTError, JWTError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido ou expirado",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    except:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token inválido",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
 
 @router.put("/clients/{client_id}", response_model=Client)
-async def update_client(client_id: int, client_update: ClientUpdate, conn = Depends(database.get_connection), token: str = Depends(oauth2_scheme)):
+def update_client(client_id: int, client_update: ClientUpdate, conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
 
@@ -125,21 +179,15 @@ async def update_client(client_id: int, client_update: ClientUpdate, conn = Depe
             )
         return updated_client
 
-    except PyJWTError:
+    except (PyJWTError, JWTError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido ou expirado",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    except:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token inválido",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
         
 @router.delete("/clients/{client_id}", response_model=dict)
-async def delete_client(client_id: int, conn = Depends(database.get_connection), token: str = Depends(oauth2_scheme)):
+def delete_client(client_id: int, conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
 
@@ -151,23 +199,17 @@ async def delete_client(client_id: int, conn = Depends(database.get_connection),
             )
         return {"message": "Cliente excluído com sucesso"}
 
-    except PyJWTError:
+    except (PyJWTError, JWTError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido ou expirado",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    except:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token inválido",
-            headers={"WWW-Authenticate": "Bearer"},
-        )        
         
 ##### Produtos #####
 
 @router.post("/products", response_model=Product)
-async def create_product(product: ProductCreate, conn = Depends(database.get_connection), token: str = Depends(oauth2_scheme)):
+def create_product(product: ProductCreate, conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         
@@ -178,7 +220,9 @@ async def create_product(product: ProductCreate, conn = Depends(database.get_con
             raise HTTPException(status_code=500,
                 detail="Erro ao criar o produto"
             )
-    except PyJWTError:
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except (PyJWTError, JWTError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido ou expirado",
@@ -186,52 +230,163 @@ async def create_product(product: ProductCreate, conn = Depends(database.get_con
         )
 
 @router.get("/products", response_model=List[Product])
-async def all_product(conn = Depends(database.get_connection), token: str = Depends(oauth2_scheme)):
+def all_product(request: Request, fields: Optional[str] = None, token: str = Depends(oauth2_scheme)):
+    selected = parse_fields(fields, database.PRODUCT_FIELDS)
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         
-        products = get_all_products(conn)
-        return products
+        return stream_response(database.stream_table(
+            database.route_deadline(request), 'products', selected or database.PRODUCT_FIELDS, database.connection_role(request),
+        ))
         
-    except PyJWTError:
-            raise HTTPException(status_code=500,
-                detail="Erro ao criar o produto"
-            )
-    except:
+    except (PyJWTError, JWTError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido ou expirado",
             headers={"WWW-Authenticate": "Bearer"},
         )
         
+@router.post("/products/batch-get", response_model=List[Product])
+def batch_get_products(batch: ProductBatchGet, conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+        return database.get_products_ids(conn, batch.ids)
+
+    except (PyJWTError, JWTError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+@router.patch("/products", response_model=List[ProductBulkResult])
+def bulk_update_products(bulk: ProductBulkUpdate, conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+        return database.bulk_update_products(conn, bulk.items)
+
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except (PyJWTError, JWTError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+@router.get("/products/changes", response_model=ProductChanges)
+def product_changes(since: Optional[str] = None, limit: int = Query(500, ge=1, le=5000), conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+        return database.get_product_changes(conn, since, limit)
+
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except (PyJWTError, JWTError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+@router.get("/products/stream")
+async def stream_product_changes(request: Request, secao: Optional[List[str]] = Query(None), product_id: Optional[List[int]] = Query(None), token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except (PyJWTError, JWTError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    from API.feed import product_feed
+    subscription = product_feed.subscribe(secao, product_id)
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['op']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            product_feed.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/products/search", response_model=List[Product])
+def search_products(q: str = Query(..., min_length=1, max_length=200), secao: Optional[str] = None, limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0), conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+        return database.search_products(conn, q, secao, limit, offset)
+
+    except (PyJWTError, JWTError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+@router.get("/products/barcode/{codigo}", response_model=Product)
+def get_product_by_barcode(request: Request, codigo: str, token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+        # Leitura em memória; uma conexão do pool só é usada quando o código não está no índice
+        product = barcode_index.get(codigo)
+        if product is None:
+            product = database.run_with_connection(
+                database.route_deadline(request), database.get_product_barcode, codigo, role=database.connection_role(request),
+            )
+            if product is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Produto não encontrado",
+                )
+            barcode_index.put(product)
+        return product
+
+    except (PyJWTError, JWTError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
 @router.get("/products/{product_id}", response_model=Product)
-async def get_product_by_id(product_id: int, conn = Depends(database.get_connection), token: str = Depends(oauth2_scheme)):
+def get_product_by_id(request: Request, product_id: int, fields: Optional[str] = None, token: str = Depends(oauth2_scheme)):
+    selected = parse_fields(fields, database.PRODUCT_FIELDS)
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         
-        product = database.get_product_id(conn, product_id)
+        role = database.connection_role(request)
+        product = read_flight.do(
+            ('GET /products/{product_id}', role, product_id, selected),
+            database.run_with_connection, database.route_deadline(request), database.get_product_id, product_id, selected, role=role,
+        )
         if product is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Produto não encontrado",
             )
-        return product
+        return sparse_response(product) if selected else product
 
-    except PyJWTError:
+    except (PyJWTError, JWTError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido ou expirado",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    except:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token inválido",
-            headers={"WWW-Authenticate": "Bearer"},
-        )                
 
 @router.put("/products/{product_id}", response_model=Product)
-async def update_product(product_id: int, product_update: ProductUpdate, conn = Depends(database.get_connection), token: str = Depends(oauth2_scheme)):
+def update_product(product_id: int, product_update: ProductUpdate, conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
 
@@ -243,21 +398,17 @@ async def update_product(product_id: int, product_update: ProductUpdate, conn =
             )
         return updated_product
 
-    except PyJWTError:
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except (PyJWTError, JWTError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido ou expirado",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    except:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token inválido",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
                 
 @router.delete("/products/{product_id}", response_model=dict)
-async def delete_product(product_id: int, conn = Depends(database.get_connection), token: str = Depends(oauth2_scheme)):
+def delete_product(product_id: int, conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
 
@@ -269,38 +420,290 @@ async def delete_product(product_id: int, conn = Depends(database.get_connection
             )
         return {"message": "Produto excluído com sucesso"}
 
-    except PyJWTError:
+    except (PyJWTError, JWTError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido ou expirado",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    except:
+
+
+@router.post("/products/{product_id}/images", response_model=Job, status_code=status.HTTP_202_ACCEPTED)
+def upload_product_image(product_id: int, file: UploadFile = File(...), conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+        # Produto conferido antes de gravar: upload para id inexistente não deixa arquivo órfão
+        if database.get_product_id(conn, product_id, ('id',)) is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Produto não encontrado")
+        # A requisição só grava o original; miniaturas e WebP são gerados por um job
+        try:
+            stored = images.store_original(file.file)
+        except images.ImageTooLarge as exc:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc))
+        except ValueError as exc:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+        try:
+            database.add_product_image(conn, product_id, stored.digest, stored.extension, stored.width, stored.height)
+        except ValueError as exc:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(exc))
+        params = {"product_id": product_id, "digest": stored.digest, "extension": stored.extension}
+        job = database.create_job(conn, "product_images", params, payload.get("sub"))
+        from API.jobs import job_runner
+        job_runner.notify()
+        return _job_response(job)
+
+    except (PyJWTError, JWTError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token inválido",
+            detail="Token inválido ou expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+@router.get("/products/{product_id}/images", response_model=List[ProductImage])
+def list_product_images(product_id: int, conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+        return [
+            ProductImage(**image, url=images.original_url(image['digest'], image['extension']))
+            for image in database.get_product_images(conn, product_id)
+        ]
+
+    except (PyJWTError, JWTError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado",
             headers={"WWW-Authenticate": "Bearer"},
         )
         
 ##### Pedidos #####
 
 @router.post("/orders", response_model=Order)
-async def create_order_route(order: OrderCreate, conn = Depends(database.get_connection), token: str = Depends(oauth2_scheme)):
+def create_order_route(order: OrderCreate, response: Response, idempotency_key: Optional[str] = Header(None), conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        
-        db_order = create_order(conn, order)
-        if db_order:
-            return db_order
+
+        def create(commit: bool):
+            try:
+                db_order = create_order(conn, order, commit=commit)
+            except ValueError as ve:
+                raise HTTPException(status_code=400, detail=str(ve))
+            if db_order:
+                return db_order
+            else:
+                raise HTTPException(status_code=500,
+                    detail="Erro ao criar o pedido"
+                )
+
+        # Repetições com a mesma Idempotency-Key recebem o pedido já criado, sem baixar o estoque de novo
+        return run_idempotent(conn, response, f"POST /orders {payload.get('sub')}", idempotency_key, order, create)
+    except (PyJWTError, JWTError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+@router.get("/orders", response_model=List[Order])
+def all_orders(request: Request, fields: Optional[str] = None, product_fields: Optional[str] = None, created_from: Optional[date] = None, created_to: Optional[date] = None, token: str = Depends(oauth2_scheme)):
+    selected = parse_fields(fields, database.ORDER_FIELDS)
+    selected_product = parse_fields(product_fields, database.PRODUCT_FIELDS)
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+        return stream_response(database.stream_orders(
+            database.route_deadline(request), selected, selected_product, created_from, created_to, database.connection_role(request),
+        ))
+
+    except (PyJWTError, JWTError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+@router.get("/orders/{order_id}", response_model=Order)
+def get_order_by_id(order_id: int, fields: Optional[str] = None, product_fields: Optional[str] = None, conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
+    selected = parse_fields(fields, database.ORDER_FIELDS)
+    selected_product = parse_fields(product_fields, database.PRODUCT_FIELDS)
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+        if selected or selected_product:
+            order = database.get_order_id(conn, order_id, selected, selected_product)
         else:
-            raise HTTPException(status_code=500,
-                detail="Erro ao criar o pedido"
+            order = database.get_order_json(conn, order_id)
+        if order is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Pedido não encontrado",
             )
-    except PyJWTError:
+        return sparse_response(order) if selected or selected_product else Response(content=order, media_type="application/json")
+
+    except (PyJWTError, JWTError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+@router.post("/orders/batch", response_model=List[OrderBatchResult])
+def create_orders_batch_route(batch: OrderBatchCreate, conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+        return database.create_orders_batch(conn, batch.orders)
+
+    except (PyJWTError, JWTError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido ou expirado",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-        
\ No newline at end of file
+##### Relatórios #####
+
+def _report_period(start: Optional[date], end: Optional[date]):
+    end = end or date.today()
+    start = start or end - timedelta(days=30)
+    if start > end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Período inválido")
+    return start, end
+
+@router.get("/reports/sales/secao", response_model=List[SecaoSales])
+def sales_by_secao(start: Optional[date] = None, end: Optional[date] = None, conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+        start, end = _report_period(start, end)
+        return database.get_sales_by_secao(conn, start, end)
+
+    except (PyJWTError, JWTError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+@router.get("/reports/sales/top-products", response_model=List[ProductSales])
+def top_products(start: Optional[date] = None, end: Optional[date] = None, limit: int = Query(10, ge=1, le=100), conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+        start, end = _report_period(start, end)
+        return database.get_top_products(conn, start, end, limit)
+
+    except (PyJWTError, JWTError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+##### Jobs #####
+
+def _job_response(job: dict) -> Job:
+    result_url = f"/jobs/{job['id']}/result" if job['status'] == 'done' else None
+    return Job(**job, result_url=result_url)
+
+def _owned_job(conn, job_id: int, username: str) -> dict:
+    job = database.get_job(conn, job_id)
+    if job is None or job['created_by'] != username:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job não encontrado")
+    return job
+
+@router.post("/jobs", response_model=Job, status_code=status.HTTP_202_ACCEPTED)
+def create_job(job: JobCreate, conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+        from API.jobs import JOB_KINDS, job_runner
+        kind = JOB_KINDS.get(job.kind)
+        if kind is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Tipo de job inválido")
+        try:
+            params = kind.params(**job.params).model_dump(mode="json")
+        except ValidationError as exc:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=jsonable_encoder(exc.errors()))
+        created = database.create_job(conn, job.kind, params, payload.get("sub"))
+        job_runner.notify()
+        return _job_response(created)
+
+    except (PyJWTError, JWTError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+@router.get("/jobs/{job_id}", response_model=Job)
+def get_job(job_id: int, conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+        return _job_response(_owned_job(conn, job_id, payload.get("sub")))
+
+    except (PyJWTError, JWTError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+@router.get("/jobs/{job_id}/result")
+def get_job_result(job_id: int, conn = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+        job = _owned_job(conn, job_id, payload.get("sub"))
+        if job['status'] != 'done':
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Job ainda não concluído")
+        path = Path(job['result_path'])
+        if not path.is_file():
+            raise HTTPException(status_code=status.HTTP_410_GONE, detail="Resultado do job expirado")
+        return FileResponse(path, media_type=job['result_type'], filename=path.name)
+
+    except (PyJWTError, JWTError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+##### Tempo real #####
+
+@router.websocket("/ws/products")
+async def product_changes_websocket(websocket: WebSocket, token: str, secao: Optional[List[str]] = Query(None), product_id: Optional[List[int]] = Query(None)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except (PyJWTError, JWTError):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    from API.feed import product_feed
+    await websocket.accept()
+    subscription = product_feed.subscribe(secao, product_id)
+    receiver = asyncio.ensure_future(websocket.receive_json())
+    getter = asyncio.ensure_future(subscription.queue.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait({receiver, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                # O cliente pode trocar a assinatura enviando {"secao": [...], "product_id": [...]}
+                try:
+                    message = receiver.result()
+                    subscription.secoes = set(message.get('secao') or []) or None
+                    subscription.product_ids = set(message.get('product_id') or []) or None
+                except (ValueError, AttributeError):
+                    pass
+                receiver = asyncio.ensure_future(websocket.receive_json())
+            if getter in done:
+                await websocket.send_json(getter.result())
+                getter = asyncio.ensure_future(subscription.queue.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        product_feed.unsubscribe(subscription)
+        receiver.cancel()
+        getter.cancel()
@@ -0,0 +1,116 @@
+import os
+import signal
+import sys
+import time
+
+import uvicorn
+
+CGROUP_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+
+
+def available_cpus() -> int:
+    # Núcleos que o processo pode usar de fato: afinidade (taskset/cpuset) e cota de CPU do cgroup do contêiner
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    try:
+        with open(CGROUP_CPU_MAX) as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, -(-int(quota) // int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+WORKERS = int(os.getenv("WEB_CONCURRENCY", str(available_cpus())))
+BACKLOG = int(os.getenv("BACKLOG", "2048"))
+KEEP_ALIVE_TIMEOUT = int(os.getenv("KEEP_ALIVE_TIMEOUT", "5"))
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+ACCESS_LOG = os.getenv("ACCESS_LOG", "true").lower() in ("1", "true", "yes")
+
+
+def build_config(app) -> uvicorn.Config:
+    return uvicorn.Config(
+        app,
+        host=HOST,
+        port=PORT,
+        loop="uvloop",
+        http="httptools",
+        backlog=BACKLOG,
+        timeout_keep_alive=KEEP_ALIVE_TIMEOUT,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        proxy_headers=True,
+        access_log=ACCESS_LOG,
+    )
+
+
+class Supervisor:
+    # Processo pai: mantém N workers que compartilham o mesmo socket já aberto
+    def __init__(self, config: uvicorn.Config, sock, workers: int):
+        self.config = config
+        self.sock = sock
+        self.workers = workers
+        self.children = set()
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            # Grupo próprio: o Ctrl-C do terminal chega só ao pai, que repassa um único SIGTERM
+            os.setpgid(0, 0)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                uvicorn.Server(self.config).run(sockets=[self.sock])
+            except BaseException:
+                code = 1
+            finally:
+                os._exit(code)
+        self.children.add(pid)
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+        print(f'INFO:     {self.workers} workers em {HOST}:{PORT} [pid {os.getpid()}]')
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            self.children.discard(pid)
+            if not self.stopping:
+                print(f'WARNING:  Worker {pid} terminou (status {status}), reiniciando', file=sys.stderr)
+                time.sleep(1)
+                self.spawn()
+
+
+def main():
+    # Pré-carrega a aplicação no pai para que os imports aconteçam uma única vez antes do fork
+    from API.main import app
+
+    config = build_config(app)
+    sock = config.bind_socket()
+    if WORKERS <= 1:
+        uvicorn.Server(config).run(sockets=[sock])
+        return
+    Supervisor(config, sock, WORKERS).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+from fastapi.testclient import TestClient
+from API.main import app
+from API.catalog import BarcodeIndex, barcode_index
+from API.models import Product
+from API.config import get_secret_key
+import jwt
+
+client = TestClient(app)
+SECRET_KEY = get_secret_key()
+
+# Função para obter autenticação
+def get_auth_header():
+    token_data = {"sub": "testuser"}
+    token = jwt.encode(token_data, SECRET_KEY, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+def make_product(id, codigo_barras, estoque=10):
+    return Product(id=id, descricao=f"Produto {id}", valor_venda=1.5, codigo_barras=codigo_barras, secao="Mercearia", estoque_inicial=estoque)
+
+# Testa a carga do índice e a busca por código de barras, ignorando produtos sem código
+def test_barcode_index_load():
+    index = BarcodeIndex()
+    assert not index.loaded
+    index.load([make_product(1, "789000000001"), make_product(2, "789000000002"), make_product(3, "")])
+    assert index.loaded
+    assert len(index) == 2
+    assert index.get("789000000001").id == 1
+    assert index.get("789000000003") is None
+
+# Testa que put troca o código antigo do produto e que remove tira o produto do índice
+def test_barcode_index_put_and_remove():
+    index = BarcodeIndex()
+    index.load([make_product(1, "789000000001")])
+
+    index.put(make_product(1, "789000000099"))
+    assert index.get("789000000001") is None
+    assert index.get("789000000099").id == 1
+    assert len(index) == 1
+
+    index.put(make_product(2, "789000000002"))
+    index.remove(1)
+    assert index.get("789000000099") is None
+    assert len(index) == 1
+    index.remove(1)
+    assert len(index) == 1
+
+# Testa que update_stock só altera o estoque de produtos presentes no índice
+def test_barcode_index_update_stock():
+    index = BarcodeIndex()
+    index.load([make_product(1, "789000000001", estoque=10)])
+    before = index.get("789000000001")
+
+    index.update_stock(1, 7)
+    assert index.get("789000000001").estoque_inicial == 7
+    assert before.estoque_inicial == 10
+    index.update_stock(99, 1)
+    assert len(index) == 1
+
+# Testa a rota de busca por código de barras, que passa a responder pelo índice depois da primeira leitura
+def test_get_product_by_barcode():
+    response = client.get("/products", headers=get_auth_header())
+    assert response.status_code == 200
+    product = next(product for product in response.json() if product["codigo_barras"])
+
+    response_barcode = client.get(f"/products/barcode/{product['codigo_barras']}", headers=get_auth_header())
+    assert response_barcode.status_code == 200
+    assert response_barcode.json()["id"] == product["id"]
+    assert barcode_index.get(product["codigo_barras"]).id == product["id"]
+
+    response_missing = client.get("/products/barcode/0000000000000", headers=get_auth_header())
+    assert response_missing.status_code == 404
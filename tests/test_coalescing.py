@@ -0,0 +1,49 @@
+import threading
+import time
+from API.coalescing import SingleFlight
+
+# Testa que chamadas simultâneas com a mesma chave executam a consulta uma única vez
+def test_concurrent_calls_share_one_query():
+    flight = SingleFlight()
+    calls = []
+
+    def query(value):
+        calls.append(value)
+        time.sleep(0.2)
+        return value * 2
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do(('GET /x', 1), query, 21))) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [21]
+    assert results == [42] * 10
+    assert flight.metrics() == {'GET /x': {'queries': 1, 'coalesced': 9, 'in_flight': 0}}
+
+# Testa que o erro da consulta compartilhada chega a todos os chamadores
+def test_error_is_shared():
+    flight = SingleFlight()
+
+    def query():
+        time.sleep(0.1)
+        raise ValueError("falhou")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do(('GET /y',), query)
+        except ValueError as exc:
+            errors.append(str(exc))
+
+    threads = [threading.Thread(target=call) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == ["falhou"] * 5
+    assert flight.metrics()['GET /y']['queries'] == 1
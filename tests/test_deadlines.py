@@ -0,0 +1,36 @@
+import os
+import pytest
+from starlette.requests import Request
+from API.main import app
+from API import database, routes
+from API.database import BlockingConnectionPool, PoolTimeout, parse_route_deadlines, route_deadline
+
+# Função para montar a requisição que chega a um endpoint
+def make_request(method, endpoint, path):
+    return Request({"type": "http", "method": method, "path": path, "headers": [], "query_string": b"", "app": app, "endpoint": endpoint})
+
+# Testa a leitura de ROUTE_DEADLINES, que normaliza os espaços da rota e ignora entradas vazias
+def test_parse_route_deadlines():
+    assert parse_route_deadlines(None) == {}
+    assert parse_route_deadlines("") == {}
+    assert parse_route_deadlines("GET /orders=30, POST  /orders/batch=2.5,") == {"GET /orders": 30.0, "POST /orders/batch": 2.5}
+    with pytest.raises(ValueError):
+        parse_route_deadlines("GET /orders=trinta")
+
+# Testa que o prazo é escolhido pela rota declarada e cai em REQUEST_DEADLINE nas rotas sem prazo próprio
+def test_route_deadline():
+    assert route_deadline(make_request("GET", routes.all_orders, "/orders")) == database.ROUTE_DEADLINES["GET /orders"]
+    assert route_deadline(make_request("GET", routes.get_product_by_id, "/products/1")) == database.REQUEST_DEADLINE
+    assert database.route_key(make_request("GET", routes.get_product_by_id, "/products/2")) == "GET /products/{product_id}"
+
+# Testa que, com o pool esgotado, a espera por uma conexão termina em PoolTimeout dentro do prazo
+def test_pool_timeout():
+    pool = BlockingConnectionPool(0, 1, os.getenv("DATABASE_URL"))
+    conn = pool.getconn()
+    try:
+        with pytest.raises(PoolTimeout):
+            pool.getconn(timeout=0.1)
+    finally:
+        pool.putconn(conn)
+    pool.putconn(pool.getconn(timeout=0.1))
+    pool.closeall()
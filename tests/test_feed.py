@@ -0,0 +1,137 @@
+import asyncio
+import json
+import random
+import time
+import psycopg2.extensions
+import jwt
+from fastapi.testclient import TestClient
+from API.main import app
+from API.config import get_secret_key
+from API.database import PRODUCT_CHANNEL, get_all_products, get_connection, product_event
+from API.feed import RESYNC_EVENT, ChangeFeed, Subscription
+from API.catalog import barcode_index
+from API.models import Product
+
+client = TestClient(app)
+SECRET_KEY = get_secret_key()
+PRODUCT_ID = 900000001
+
+# Função para obter autenticação
+def get_auth_header():
+    token_data = {"sub": "testuser"}
+    token = jwt.encode(token_data, SECRET_KEY, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+def make_event(op, codigo_barras="7890000009001"):
+    product = {"id": PRODUCT_ID, "descricao": "Produto feed", "valor_venda": 2.0, "codigo_barras": codigo_barras,
+               "secao": "Mercearia", "estoque_inicial": 5, "data_validade": None, "imagens": []}
+    return product_event(op, PRODUCT_ID, secao="Mercearia", estoque_inicial=5, codigo_barras=codigo_barras, product=product)
+
+# Testa o filtro de eventos por seção e por id de produto
+def test_subscription_matches():
+    assert Subscription().matches({"id": 1, "secao": "Bebidas"})
+    by_secao = Subscription(secoes=["Bebidas"])
+    assert by_secao.matches({"id": 1, "secao": "Bebidas"})
+    assert not by_secao.matches({"id": 1, "secao": "Mercearia"})
+    by_id = Subscription(product_ids=[2])
+    assert by_id.matches({"id": 2, "secao": "Mercearia"})
+    assert not by_id.matches({"id": 1, "secao": "Mercearia"})
+
+# Testa que a fila cheia descarta os eventos pendentes e deixa apenas um pedido de resync
+def test_subscription_push_overflow():
+    subscription = Subscription()
+    subscription.queue = asyncio.Queue(maxsize=3)
+    for index in range(3):
+        subscription.push({"op": "stock", "id": index})
+    subscription.push({"op": "stock", "id": 3})
+
+    assert subscription.dropped == 3
+    assert subscription.resyncs == 1
+    assert subscription.queue.qsize() == 1
+    assert subscription.queue.get_nowait() == RESYNC_EVENT
+
+    subscription.push({"op": "stock", "id": 4})
+    assert subscription.queue.get_nowait() == {"op": "stock", "id": 4}
+
+# Testa que as métricas do feed mantêm os descartes de assinantes que já saíram
+def test_feed_metrics_keep_unsubscribed_counts():
+    feed = ChangeFeed()
+    subscription = feed.subscribe()
+    subscription.queue = asyncio.Queue(maxsize=1)
+    feed.publish({"op": "stock", "id": PRODUCT_ID, "secao": "Mercearia", "estoque_inicial": 1})
+    feed.publish({"op": "stock", "id": PRODUCT_ID, "secao": "Mercearia", "estoque_inicial": 2})
+    assert feed.metrics() == {"subscribers": 1, "dropped": 1, "resyncs": 1}
+
+    feed.unsubscribe(subscription)
+    assert feed.metrics() == {"subscribers": 0, "dropped": 1, "resyncs": 1}
+
+# Testa que os eventos publicados atualizam o índice de códigos de barras
+def test_feed_publish_updates_barcode_index():
+    feed = ChangeFeed()
+    try:
+        feed.publish(make_event("create"))
+        assert barcode_index.get("7890000009001").estoque_inicial == 5
+
+        feed.publish(product_event("stock", PRODUCT_ID, secao="Mercearia", estoque_inicial=3))
+        assert barcode_index.get("7890000009001").estoque_inicial == 3
+
+        feed.publish(make_event("update", "7890000009002"))
+        assert barcode_index.get("7890000009001") is None
+        assert barcode_index.get("7890000009002").id == PRODUCT_ID
+
+        feed.publish(product_event("delete", PRODUCT_ID, secao="Mercearia"))
+        assert barcode_index.get("7890000009002") is None
+    finally:
+        barcode_index.remove(PRODUCT_ID)
+
+# Testa que cada (re)conexão do feed recarrega o índice de códigos de barras do banco antes de pedir o resync
+def test_feed_connect_reloads_barcode_index():
+    async def reconnect(feed):
+        feed._loop = asyncio.get_running_loop()
+        await asyncio.to_thread(feed._connect)
+        await asyncio.sleep(0)
+        feed._disconnect()
+
+    feed = ChangeFeed()
+    subscription = feed.subscribe()
+    barcode_index.load([])
+    barcode_index.put(Product(**make_event("create")["product"]))
+
+    asyncio.run(reconnect(feed))
+
+    assert barcode_index.get("7890000009001") is None
+    with get_connection() as conn:
+        products = [product for product in get_all_products(conn) if product.codigo_barras]
+    assert len(barcode_index) == len({product.codigo_barras for product in products})
+    for product in products:
+        assert barcode_index.get(product.codigo_barras) is not None
+    assert subscription.queue.get_nowait() == RESYNC_EVENT
+
+# Testa que um pedido publica no canal de produtos o evento de estoque com o saldo após a venda
+def test_order_publishes_stock_event():
+    listener = get_connection()
+    listener.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    try:
+        with listener.cursor() as cur:
+            cur.execute(f"LISTEN {PRODUCT_CHANNEL}")
+        product = client.post("/products", json={
+            "descricao": "Produto estoque", "valor_venda": 1.0, "codigo_barras": str(random.randrange(10 ** 12, 10 ** 13)),
+            "secao": "Mercearia", "estoque_inicial": 6,
+        }, headers=get_auth_header()).json()
+        client_id = client.get("/clients", headers=get_auth_header()).json()[0]["id"]
+        response = client.post("/orders", json={"client_id": client_id, "items": [{"product_id": product["id"], "quantity": 4}]}, headers=get_auth_header())
+        assert response.status_code == 200
+
+        events = []
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and not any(event["op"] == "stock" and event["id"] == product["id"] for event in events):
+            listener.poll()
+            events += [json.loads(notify.payload) for notify in listener.notifies]
+            listener.notifies.clear()
+            time.sleep(0.05)
+        assert any(event["op"] == "create" and event["id"] == product["id"] for event in events)
+        stock = [event for event in events if event["op"] == "stock" and event["id"] == product["id"]]
+        assert stock and stock[0]["estoque_inicial"] == 2
+        assert stock[0]["secao"] == "Mercearia"
+    finally:
+        listener.close()
@@ -0,0 +1,70 @@
+import random
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from API.main import app
+from API.routes import parse_fields
+from API.database import PRODUCT_FIELDS
+from API.config import get_secret_key
+import jwt
+
+client = TestClient(app)
+SECRET_KEY = get_secret_key()
+
+# Função para obter autenticação
+def get_auth_header():
+    token_data = {"sub": "testuser"}
+    token = jwt.encode(token_data, SECRET_KEY, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+# Testa a leitura do parâmetro fields: espaços e repetições são ignorados e campos fora da lista são recusados
+def test_parse_fields():
+    assert parse_fields(None, PRODUCT_FIELDS) is None
+    assert parse_fields("", PRODUCT_FIELDS) is None
+    assert parse_fields(" id, descricao,id ", PRODUCT_FIELDS) == ("id", "descricao")
+    for fields in ("id,senha", ",", "Id"):
+        with pytest.raises(HTTPException) as exc:
+            parse_fields(fields, PRODUCT_FIELDS)
+        assert exc.value.status_code == 400
+
+# Testa que as listagens e buscas por id de produtos e clientes devolvem só os campos pedidos
+def test_products_and_clients_fields():
+    response = client.get("/products", params={"fields": "id,descricao"}, headers=get_auth_header())
+    assert response.status_code == 200
+    products = response.json()
+    assert products and all(set(product) == {"id", "descricao"} for product in products)
+
+    response = client.get(f"/products/{products[0]['id']}", params={"fields": "valor_venda,id"}, headers=get_auth_header())
+    assert response.status_code == 200
+    assert set(response.json()) == {"id", "valor_venda"}
+
+    response = client.get("/clients", params={"fields": "id,nome"}, headers=get_auth_header())
+    assert response.status_code == 200
+    clients = response.json()
+    assert clients and all(set(item) == {"id", "nome"} for item in clients)
+
+    response = client.get(f"/clients/{clients[0]['id']}", params={"fields": "email"}, headers=get_auth_header())
+    assert response.status_code == 200
+    assert set(response.json()) == {"email"}
+
+    response = client.get("/products", params={"fields": "id,senha"}, headers=get_auth_header())
+    assert response.status_code == 400
+
+# Testa os campos do pedido e os campos do produto dentro dos itens
+def test_order_fields():
+    product = client.post("/products", json={
+        "descricao": "Produto campos", "valor_venda": 1.25, "codigo_barras": str(random.randrange(10 ** 12, 10 ** 13)),
+        "secao": "Mercearia", "estoque_inicial": 5,
+    }, headers=get_auth_header()).json()
+    client_id = client.get("/clients", headers=get_auth_header()).json()[0]["id"]
+    order = client.post("/orders", json={"client_id": client_id, "items": [{"product_id": product["id"], "quantity": 2}]}, headers=get_auth_header()).json()
+
+    response = client.get(f"/orders/{order['id']}", params={"fields": "id,total"}, headers=get_auth_header())
+    assert response.status_code == 200
+    assert response.json() == {"id": order["id"], "total": 2.5}
+
+    response = client.get(f"/orders/{order['id']}", params={"fields": "id,items", "product_fields": "descricao"}, headers=get_auth_header())
+    assert response.status_code == 200
+    data = response.json()
+    assert set(data) == {"id", "items"}
+    assert [item["product"] for item in data["items"]] == [{"descricao": "Produto campos"}]
@@ -0,0 +1,34 @@
+from fastapi.testclient import TestClient
+from API.main import app
+from API.config import get_secret_key
+import jwt
+
+client = TestClient(app)
+SECRET_KEY = get_secret_key()
+
+# Função para obter autenticação
+def get_auth_header():
+    token_data = {"sub": "testuser"}
+    token = jwt.encode(token_data, SECRET_KEY, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+# Testa a rota de liveness
+def test_healthz():
+    response = client.get("/healthz")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ok"
+
+# Testa a rota de readiness antes do aquecimento terminar
+def test_readyz_before_warm_up():
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["status"] == "aquecendo"
+
+# Testa que a rota de métricas exige autenticação
+def test_metrics_requires_auth():
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer invalido"}).status_code == 401
+
+    response = client.get("/metrics", headers=get_auth_header())
+    assert response.status_code == 200
+    assert set(response.json()) == {"statements", "coalescing", "routing", "feed"}
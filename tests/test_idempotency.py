@@ -0,0 +1,158 @@
+import random
+import threading
+import time
+import uuid
+import pytest
+import jwt
+from fastapi import HTTPException, Response
+from fastapi.testclient import TestClient
+from API.main import app
+from API.config import get_secret_key
+from API.database import create_idempotency_table, get_connection
+from API.idempotency import REPLAYED_HEADER, request_hash, run_idempotent
+
+client = TestClient(app)
+SECRET_KEY = get_secret_key()
+
+# Função para obter autenticação
+def get_auth_header():
+    token_data = {"sub": "testuser"}
+    token = jwt.encode(token_data, SECRET_KEY, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+# Testa que o hash da requisição não depende da ordem das chaves do corpo
+def test_request_hash_ignores_key_order():
+    assert request_hash({"client_id": 1, "items": [{"product_id": 2, "quantity": 1}]}) == \
+        request_hash({"items": [{"quantity": 1, "product_id": 2}], "client_id": 1})
+    assert request_hash({"client_id": 1}) != request_hash({"client_id": 2})
+
+# Testa que uma Idempotency-Key vazia ou longa demais é recusada antes de qualquer acesso ao banco
+def test_invalid_idempotency_key():
+    for key in ("", "x" * 256):
+        with pytest.raises(HTTPException) as exc:
+            run_idempotent(None, None, "POST /orders user", key, {}, lambda commit: pytest.fail("não deveria executar"))
+        assert exc.value.status_code == 400
+
+# Função para abrir uma conexão com a tabela de chaves criada
+def connect():
+    conn = get_connection()
+    create_idempotency_table(conn)
+    return conn
+
+# Testa que a repetição de uma requisição concluída devolve a resposta guardada sem executar a escrita de novo
+def test_replay_stored_response():
+    key = str(uuid.uuid4())
+    calls = []
+
+    def create(commit):
+        calls.append(commit)
+        return {"id": 1}
+
+    conn = connect()
+    try:
+        first = Response()
+        assert run_idempotent(conn, first, "POST /orders user", key, {"client_id": 1}, create, status_code=201) == {"id": 1}
+        assert first.status_code == 201
+        assert REPLAYED_HEADER not in first.headers
+
+        again = Response()
+        assert run_idempotent(conn, again, "POST /orders user", key, {"client_id": 1}, create, status_code=201) == {"id": 1}
+        assert again.status_code == 201
+        assert again.headers[REPLAYED_HEADER] == "true"
+        assert calls == [False]
+    finally:
+        conn.close()
+
+# Testa que um erro 4xx fica guardado e é repetido, enquanto um erro 5xx não fica e a repetição executa de novo
+def test_replay_stored_error():
+    key = str(uuid.uuid4())
+    calls = []
+
+    def not_found(commit):
+        calls.append(commit)
+        raise HTTPException(status_code=404, detail="Produto não encontrado")
+
+    def unavailable(commit):
+        calls.append(commit)
+        raise HTTPException(status_code=503, detail="Indisponível")
+
+    conn = connect()
+    try:
+        for _ in range(2):
+            with pytest.raises(HTTPException) as exc:
+                run_idempotent(conn, Response(), "POST /orders user", key, {}, not_found)
+            assert exc.value.status_code == 404
+            assert exc.value.detail == "Produto não encontrado"
+        assert exc.value.headers == {REPLAYED_HEADER: "true"}
+        assert len(calls) == 1
+
+        key = str(uuid.uuid4())
+        for _ in range(2):
+            with pytest.raises(HTTPException) as exc:
+                run_idempotent(conn, Response(), "POST /orders user", key, {}, unavailable)
+            assert exc.value.status_code == 503
+        assert len(calls) == 3
+    finally:
+        conn.close()
+
+# Testa que reutilizar a chave com outro corpo é recusado com 422
+def test_key_reused_with_other_body():
+    key = str(uuid.uuid4())
+    conn = connect()
+    try:
+        run_idempotent(conn, Response(), "POST /orders user", key, {"client_id": 1}, lambda commit: {"id": 1})
+        with pytest.raises(HTTPException) as exc:
+            run_idempotent(conn, Response(), "POST /orders user", key, {"client_id": 2}, lambda commit: pytest.fail("não deveria executar"))
+        assert exc.value.status_code == 422
+    finally:
+        conn.close()
+
+# Testa que uma repetição simultânea espera a trava da original e recebe a resposta gravada por ela
+def test_concurrent_duplicate_waits_for_original():
+    key = str(uuid.uuid4())
+    calls = []
+    started = threading.Event()
+
+    def create(commit):
+        calls.append(commit)
+        started.set()
+        time.sleep(0.5)
+        return {"id": 7}
+
+    results = {}
+
+    def call(name):
+        conn = connect()
+        try:
+            response = Response()
+            results[name] = (run_idempotent(conn, response, "POST /orders user", key, {}, create), response.headers.get(REPLAYED_HEADER))
+        finally:
+            conn.close()
+
+    original = threading.Thread(target=call, args=("original",))
+    original.start()
+    started.wait(5)
+    duplicate = threading.Thread(target=call, args=("duplicate",))
+    duplicate.start()
+    original.join()
+    duplicate.join()
+
+    assert calls == [False]
+    assert results == {"original": ({"id": 7}, None), "duplicate": ({"id": 7}, "true")}
+
+# Testa a rota de pedidos com Idempotency-Key: a repetição devolve o mesmo pedido e o estoque só baixa uma vez
+def test_create_order_idempotent_route():
+    product = client.post("/products", json={
+        "descricao": "Produto idempotência", "valor_venda": 3.0, "codigo_barras": str(random.randrange(10 ** 12, 10 ** 13)),
+        "secao": "Mercearia", "estoque_inicial": 10,
+    }, headers=get_auth_header()).json()
+    client_id = client.get("/clients", headers=get_auth_header()).json()[0]["id"]
+    order = {"client_id": client_id, "items": [{"product_id": product["id"], "quantity": 4}]}
+    headers = {**get_auth_header(), "Idempotency-Key": str(uuid.uuid4())}
+
+    first = client.post("/orders", json=order, headers=headers)
+    again = client.post("/orders", json=order, headers=headers)
+    assert first.status_code == again.status_code == 200
+    assert again.headers[REPLAYED_HEADER] == "true"
+    assert again.json()["id"] == first.json()["id"]
+    assert client.get(f"/products/{product['id']}", headers=get_auth_header()).json()["estoque_inicial"] == 6
@@ -0,0 +1,114 @@
+import hashlib
+import io
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from PIL import Image
+from API.main import app
+from API import images
+from API.config import get_secret_key
+import jwt
+
+client = TestClient(app)
+SECRET_KEY = get_secret_key()
+
+# Função para obter autenticação
+def get_auth_header():
+    token_data = {"sub": "testuser"}
+    token = jwt.encode(token_data, SECRET_KEY, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+# Função para gerar um PNG em memória
+def make_png(size=(40, 20)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 10, 10)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+# Diretório de imagens temporário para cada teste
+@pytest.fixture
+def image_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(images, "IMAGE_DIR", tmp_path)
+    return tmp_path
+
+# Testa a leitura de IMAGE_SIZES no formato "thumb=200,medium=800"
+def test_parse_image_sizes():
+    assert images.parse_image_sizes("thumb=200, medium=800") == {"thumb": 200, "medium": 800}
+    assert images.parse_image_sizes("") == {}
+
+# Testa a leitura do cabeçalho Range: intervalo fechado, aberto, sufixo e cabeçalhos ignorados
+def test_parse_range():
+    assert images._parse_range(None, 100) is None
+    assert images._parse_range("bytes=0-9", 100) == (0, 9)
+    assert images._parse_range("bytes=90-", 100) == (90, 99)
+    assert images._parse_range("bytes=50-500", 100) == (50, 99)
+    assert images._parse_range("bytes=-10", 100) == (90, 99)
+    assert images._parse_range("bytes=-500", 100) == (0, 99)
+    assert images._parse_range("bytes=0-1,5-9", 100) is None
+    assert images._parse_range("bytes=-", 100) is None
+    assert images._parse_range("items=0-9", 100) is None
+
+# Testa que intervalos fora do arquivo são recusados com 416 e Content-Range com o tamanho
+def test_parse_range_not_satisfiable():
+    for header in ("bytes=100-", "bytes=10-5"):
+        with pytest.raises(HTTPException) as exc:
+            images._parse_range(header, 100)
+        assert exc.value.status_code == 416
+        assert exc.value.headers["Content-Range"] == "bytes */100"
+
+# Testa a gravação do original: o nome é o SHA-256 do conteúdo e o formato vem do cabeçalho da imagem
+def test_store_original(image_dir):
+    data = make_png()
+    stored = images.store_original(io.BytesIO(data))
+    assert stored == images.StoredImage(hashlib.sha256(data).hexdigest(), "png", 40, 20)
+    assert images.original_path(stored.digest, "png").read_bytes() == data
+    assert images.store_original(io.BytesIO(data)) == stored
+
+# Testa que arquivos que não são imagem ou maiores que o limite são recusados sem deixar arquivos no disco
+def test_store_original_invalid(image_dir, monkeypatch):
+    with pytest.raises(ValueError):
+        images.store_original(io.BytesIO(b"nao e imagem"))
+    monkeypatch.setattr(images, "IMAGE_MAX_BYTES", 10)
+    with pytest.raises(images.ImageTooLarge):
+        images.store_original(io.BytesIO(make_png()))
+    assert not any(path.is_file() for path in image_dir.rglob("*"))
+
+# Testa a geração das variantes em WebP e no formato de fallback
+def test_generate_variants(image_dir, monkeypatch):
+    monkeypatch.setattr(images, "IMAGE_SIZES", {"thumb": 10})
+    stored = images.store_original(io.BytesIO(make_png()))
+    variants = images.generate_variants(stored.digest, stored.extension)
+    assert set(variants) == {"full.webp", "thumb.webp", "thumb.jpg"}
+    with Image.open(images.variant_path(stored.digest, "thumb.jpg")) as thumb:
+        assert thumb.size == (10, 5)
+
+# Testa a entrega da imagem pela rota /images: arquivo inteiro, intervalo, ETag e nomes inválidos
+def test_get_original(image_dir):
+    data = make_png()
+    stored = images.store_original(io.BytesIO(data))
+    url = images.original_url(stored.digest, stored.extension)
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content == data
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["accept-ranges"] == "bytes"
+
+    response_range = client.get(url, headers={"Range": "bytes=0-9"})
+    assert response_range.status_code == 206
+    assert response_range.content == data[:10]
+    assert response_range.headers["content-range"] == f"bytes 0-9/{len(data)}"
+
+    response_cached = client.get(url, headers={"If-None-Match": response.headers["etag"]})
+    assert response_cached.status_code == 304
+
+    response_invalid = client.get(url, headers={"Range": f"bytes={len(data)}-"})
+    assert response_invalid.status_code == 416
+
+    assert client.get("/images/nao-existe.png").status_code == 404
+    assert client.get(f"/images/{'0' * 64}.png").status_code == 404
+
+# Testa que o envio de imagem para um produto inexistente responde 404 sem gravar o arquivo
+def test_upload_image_product_not_found(image_dir):
+    response = client.post("/products/0/images", files={"file": ("foto.png", make_png(), "image/png")}, headers=get_auth_header())
+    assert response.status_code == 404
+    assert not any(path.is_file() for path in image_dir.rglob("*"))
@@ -0,0 +1,56 @@
+from pydantic import BaseModel
+from API import database, jobs
+from API.database import get_connection
+
+class NoParams(BaseModel):
+    pass
+
+# Função para abrir as conexões do runner com um statement_timeout curto
+def connect(timeout_ms):
+    conn = get_connection()
+    with conn.cursor() as cur:
+        cur.execute("SELECT set_config('statement_timeout', %s, false)", (str(timeout_ms),))
+    conn.commit()
+    return conn, get_connection()
+
+# Testa que um job que passa do statement_timeout é marcado como falho em vez de ficar em execução
+def test_job_statement_timeout_fails_job(monkeypatch):
+    def slow(conn, job_id, params, progress):
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_sleep(5)")
+    monkeypatch.setitem(jobs.JOB_KINDS, "test_slow", jobs.JobKind(NoParams, slow))
+
+    conn, control = connect(100)
+    try:
+        database.create_jobs_table(control)
+        job = database.create_job(control, "test_slow", {}, "testuser")
+        jobs.JobRunner()._run(conn, control, job)
+
+        stored = database.get_job(control, job["id"])
+        assert stored["status"] == "failed"
+        assert stored["error"].startswith("Tempo limite excedido")
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+            assert cur.fetchone() == (1,)
+    finally:
+        conn.close()
+        control.close()
+
+# Testa que um job com erro comum é marcado como falho com a mensagem do erro
+def test_job_error_fails_job(monkeypatch):
+    def broken(conn, job_id, params, progress):
+        raise ValueError("falhou")
+    monkeypatch.setitem(jobs.JOB_KINDS, "test_broken", jobs.JobKind(NoParams, broken))
+
+    conn, control = connect(1000)
+    try:
+        database.create_jobs_table(control)
+        job = database.create_job(control, "test_broken", {}, "testuser")
+        jobs.JobRunner()._run(conn, control, job)
+
+        stored = database.get_job(control, job["id"])
+        assert stored["status"] == "failed"
+        assert stored["error"] == "falhou"
+    finally:
+        conn.close()
+        control.close()
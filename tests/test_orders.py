@@ -0,0 +1,83 @@
+import random
+from fastapi.testclient import TestClient
+from API.main import app
+from API.config import get_secret_key
+import jwt
+
+client = TestClient(app)
+SECRET_KEY = get_secret_key()
+
+# Função para obter autenticação
+def get_auth_header():
+    token_data = {"sub": "testuser"}
+    token = jwt.encode(token_data, SECRET_KEY, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+# Função para criar um produto de teste com o estoque informado
+def create_product(estoque, valor_venda=2.5):
+    product = {
+        "descricao": "Produto pedidos",
+        "valor_venda": valor_venda,
+        "codigo_barras": str(random.randrange(10 ** 12, 10 ** 13)),
+        "secao": "Mercearia",
+        "estoque_inicial": estoque,
+    }
+    response = client.post("/products", json=product, headers=get_auth_header())
+    assert response.status_code == 200
+    return response.json()
+
+# Função para obter o id de um cliente existente
+def get_client_id():
+    response = client.get("/clients", headers=get_auth_header())
+    assert response.status_code == 200
+    return response.json()[0]["id"]
+
+# Testa que o lote grava os pedidos válidos e devolve o erro de cada pedido inválido ou vazio
+def test_create_orders_batch_mixed():
+    product = create_product(5)
+    client_id = get_client_id()
+    orders = [
+        {"client_id": client_id, "items": [{"product_id": product["id"], "quantity": 2}]},
+        {"client_id": client_id, "items": []},
+        {"client_id": client_id, "items": [{"product_id": product["id"], "quantity": 10}]},
+        {"client_id": 0, "items": [{"product_id": product["id"], "quantity": 1}]},
+        {"client_id": client_id, "items": [{"product_id": product["id"], "quantity": 3}]},
+    ]
+    response = client.post("/orders/batch", json={"orders": orders}, headers=get_auth_header())
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["created"] for result in results] == [True, False, False, False, True]
+    assert results[1]["error"] == "Pedido sem itens"
+    assert results[2]["error"] == f"Estoque insuficiente para o produto com ID {product['id']}"
+    assert results[3]["error"] == "Cliente com ID 0 não encontrado"
+    assert results[4]["order"]["total"] == 7.5
+
+    response_product = client.get(f"/products/{product['id']}", headers=get_auth_header())
+    assert response_product.json()["estoque_inicial"] == 0
+
+# Testa que um lote só com pedidos vazios não grava nada
+def test_create_orders_batch_only_empty():
+    response = client.post("/orders/batch", json={"orders": [{"client_id": get_client_id(), "items": []}]}, headers=get_auth_header())
+    assert response.status_code == 200
+    assert response.json() == [{"index": 0, "created": False, "order": None, "error": "Pedido sem itens"}]
+
+# Testa que o pedido guarda o preço e o retrato do produto do momento da venda, mesmo após o produto mudar
+def test_order_keeps_price_snapshot():
+    product = create_product(10, valor_venda=2.0)
+    client_id = get_client_id()
+    response = client.post("/orders", json={"client_id": client_id, "items": [{"product_id": product["id"], "quantity": 3}]}, headers=get_auth_header())
+    assert response.status_code == 200
+    order = response.json()
+    assert order["total"] == 6.0
+    assert order["items"][0]["unit_price"] == 2.0
+    assert order["items"][0]["product"]["estoque_inicial"] == 7
+
+    response_update = client.put(f"/products/{product['id']}", json={"valor_venda": 9.0, "descricao": "Produto renomeado"}, headers=get_auth_header())
+    assert response_update.status_code == 200
+
+    stored = client.get(f"/orders/{order['id']}", headers=get_auth_header()).json()
+    assert stored["total"] == 6.0
+    assert stored["client"]["id"] == client_id
+    assert stored["items"][0]["unit_price"] == 2.0
+    assert stored["items"][0]["product"]["valor_venda"] == 2.0
+    assert stored["items"][0]["product"]["descricao"] == "Produto pedidos"
@@ -0,0 +1,93 @@
+import argparse
+import csv
+import gzip
+from datetime import date
+import pytest
+from API import database, partitions
+from API.database import ORDER_PARTITION_NAME, add_months, get_connection, month_start, order_partition_name
+from API.partitions import _old_months, _parse_month
+from API.models import Order, OrderItem
+
+# Testa o primeiro dia do mês usado como limite das partições
+def test_month_start():
+    assert month_start(date(2024, 2, 29)) == date(2024, 2, 1)
+    assert month_start(date(2024, 1, 1)) == date(2024, 1, 1)
+
+# Testa a soma de meses, inclusive na virada do ano e com valores negativos
+def test_add_months():
+    assert add_months(date(2024, 1, 1), 1) == date(2024, 2, 1)
+    assert add_months(date(2024, 11, 1), 2) == date(2025, 1, 1)
+    assert add_months(date(2024, 12, 1), 13) == date(2026, 1, 1)
+    assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+    assert add_months(date(2024, 3, 1), 0) == date(2024, 3, 1)
+
+# Testa o nome das partições mensais e a leitura de volta pelo padrão ORDER_PARTITION_NAME
+def test_order_partition_name():
+    assert order_partition_name("orders", date(2024, 3, 1)) == "orders_2024_03"
+    assert order_partition_name("order_items", date(2025, 12, 1)) == "order_items_2025_12"
+    assert ORDER_PARTITION_NAME.match("order_items_2025_12").groups() == ("order_items", "2025", "12")
+    assert ORDER_PARTITION_NAME.match("orders_default") is None
+    assert ORDER_PARTITION_NAME.match("clients_2024_03") is None
+
+# Testa a leitura do mês (AAAA-MM) na linha de comando de partições
+def test_parse_month():
+    assert _parse_month("2024-03") == date(2024, 3, 1)
+    for value in ("2024-13", "03-2024", "2024"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            _parse_month(value)
+
+# Testa que as partições do mês corrente e dos meses seguintes existem e que o mês corrente não pode ser arquivado
+def test_ensure_order_partitions():
+    with get_connection() as conn:
+        database.create_orders_table(conn)
+        database.ensure_order_partitions(conn, 2)
+        current = month_start(date.today())
+        attached = {partition['name'] for partition in database.list_order_partitions(conn) if partition['attached']}
+        for count in range(3):
+            for table in database.ORDER_TABLES:
+                assert order_partition_name(table, add_months(current, count)) in attached
+
+        with pytest.raises(SystemExit):
+            _old_months(conn, add_months(current, 1))
+        assert all(month < current for month in _old_months(conn, current))
+
+# Testa que um mês com pedidos é desanexado sem a FK para orders e depois arquivado em .csv.gz e removido
+def test_detach_and_archive_month(tmp_path):
+    month = date(2001, 1, 1)
+    names = [order_partition_name(table, month) for table in database.ORDER_TABLES]
+    conn = get_connection()
+    try:
+        database.create_orders_table(conn)
+        product = database.get_all_products(conn)[0]
+        buyer = database.get_all_clients(conn)[0]
+        with conn.cursor() as cur:
+            database.create_order_partitions(cur, month, month)
+            order_id = database._reserve_ids(cur, 'orders', 1)[0]
+            item_id = database._reserve_ids(cur, 'order_items', 1)[0]
+            item = OrderItem(id=item_id, order_id=order_id, product_id=product.id, quantity=1, unit_price=product.valor_venda, product=product)
+            database.insert_orders(cur, [Order(id=order_id, client_id=buyer.id, total=product.valor_venda, created_at=date(2001, 1, 15), items=[item], client=buyer)])
+        conn.commit()
+
+        assert database.detach_order_partitions(conn, month) == list(reversed(names))
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT count(*) FROM pg_constraint
+                WHERE conrelid = to_regclass(%s) AND contype = 'f' AND confrelid = 'orders'::regclass
+            """, (order_partition_name('order_items', month),))
+            assert cur.fetchone()[0] == 0
+        conn.commit()
+        assert {p['name']: p['attached'] for p in database.list_order_partitions(conn) if p['month'] == month} == dict.fromkeys(names, False)
+
+        partitions.main(["archive", "--before", "2001-02", "--dir", str(tmp_path)])
+        for name in names:
+            with gzip.open(tmp_path / f"{name}.csv.gz", "rt") as archived:
+                rows = list(csv.reader(archived))
+            assert rows[1][0] == str(item_id if name.startswith("order_items") else order_id)
+        assert not [p for p in database.list_order_partitions(conn) if p['month'] == month]
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            for name in names:
+                cur.execute(f"DROP TABLE IF EXISTS {name}")
+        conn.commit()
+        conn.close()
@@ -0,0 +1,55 @@
+import random
+from fastapi.testclient import TestClient
+from API.main import app
+from API.database import get_connection
+from API.config import get_secret_key
+import jwt
+
+client = TestClient(app)
+SECRET_KEY = get_secret_key()
+
+# Função para obter autenticação
+def get_auth_header():
+    token_data = {"sub": "testuser"}
+    token = jwt.encode(token_data, SECRET_KEY, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+# Testa a busca de vários produtos em uma única requisição
+def test_batch_get_products():
+    with get_connection() as conn:
+        response = client.get("/products", headers=get_auth_header())
+        assert response.status_code == 200
+        ids = [product["id"] for product in response.json()][:3]
+
+        response_batch = client.post("/products/batch-get", json={"ids": ids + [0]}, headers=get_auth_header())
+        assert response_batch.status_code == 200
+        assert [product["id"] for product in response_batch.json()] == ids
+
+# Testa a atualização em lote com um id inexistente
+def test_bulk_update_products_not_found():
+    with get_connection() as conn:
+        response = client.patch("/products", json={"items": [{"id": 0, "valor_venda": 1.0}]}, headers=get_auth_header())
+        assert response.status_code == 200
+        data = response.json()
+        assert data == [{"id": 0, "updated": False, "product": None}]
+
+# Testa a atualização em lote de um produto existente: atualizações repetidas do mesmo id são combinadas campo a campo
+def test_bulk_update_products():
+    with get_connection() as conn:
+        response = client.post("/products", json={
+            "descricao": "Produto lote", "valor_venda": 1.0, "codigo_barras": str(random.randrange(10 ** 12, 10 ** 13)),
+            "secao": "Mercearia", "estoque_inicial": 3,
+        }, headers=get_auth_header())
+        product_id = response.json()["id"]
+
+        items = [{"id": product_id, "valor_venda": 2.0}, {"id": product_id, "estoque_inicial": 8}, {"id": product_id, "valor_venda": 4.5}]
+        response = client.patch("/products", json={"items": items}, headers=get_auth_header())
+        assert response.status_code == 200
+        data = response.json()
+        assert [(result["id"], result["updated"]) for result in data] == [(product_id, True)]
+        assert data[0]["product"]["valor_venda"] == 4.5
+        assert data[0]["product"]["estoque_inicial"] == 8
+        assert data[0]["product"]["descricao"] == "Produto lote"
+
+        response_get = client.get(f"/products/{product_id}", headers=get_auth_header())
+        assert response_get.json()["valor_venda"] == 4.5
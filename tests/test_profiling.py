@@ -0,0 +1,49 @@
+import pstats
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from API import profiling
+
+# Função para montar uma aplicação com uma rota síncrona perfilada em todas as requisições
+def make_client():
+    app = FastAPI()
+
+    @app.get("/soma")
+    def soma():
+        return {"total": sum(range(1000))}
+
+    profiling.instrument_routes(app)
+    return TestClient(profiling.ProfilingMiddleware(app, sample_rate=1))
+
+# Testa que a requisição perfilada grava um perfil com a função da rota
+def test_profile_is_stored(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "store", profiling.ProfileStore(tmp_path, 5))
+    response = make_client().get("/soma")
+    assert response.status_code == 200
+    assert response.json() == {"total": 499500}
+
+    profiles = profiling.store.list()
+    assert len(profiles) == 1
+    assert "-GET-soma-" in profiles[0].name
+    functions = {name for _, _, name in pstats.Stats(str(profiles[0])).stats}
+    assert "soma" in functions
+
+# Testa que uma falha ao gravar o perfil não altera a resposta da requisição
+def test_failing_store_keeps_response(tmp_path, monkeypatch):
+    store = profiling.ProfileStore(tmp_path, 5)
+
+    def fail(*args, **kwargs):
+        raise OSError("disco cheio")
+
+    monkeypatch.setattr(store, "save", fail)
+    monkeypatch.setattr(profiling, "store", store)
+    response = make_client().get("/soma")
+    assert response.status_code == 200
+    assert response.json() == {"total": 499500}
+
+# Testa que o buffer circular mantém apenas os perfis mais recentes
+def test_profile_store_trim(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "store", profiling.ProfileStore(tmp_path, 2))
+    client = make_client()
+    for _ in range(4):
+        assert client.get("/soma").status_code == 200
+    assert len(profiling.store.list()) == 2
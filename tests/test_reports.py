@@ -0,0 +1,43 @@
+from datetime import date, timedelta
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from API.main import app
+from API.routes import _report_period
+from API.config import get_secret_key
+import jwt
+
+client = TestClient(app)
+SECRET_KEY = get_secret_key()
+
+# Função para obter autenticação
+def get_auth_header():
+    token_data = {"sub": "testuser"}
+    token = jwt.encode(token_data, SECRET_KEY, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+# Testa que o período padrão dos relatórios são os últimos 30 dias até hoje
+def test_report_period_defaults():
+    assert _report_period(None, None) == (date.today() - timedelta(days=30), date.today())
+    assert _report_period(None, date(2024, 3, 31)) == (date(2024, 3, 1), date(2024, 3, 31))
+    assert _report_period(date(2024, 1, 1), date(2024, 1, 1)) == (date(2024, 1, 1), date(2024, 1, 1))
+
+# Testa que um período com início depois do fim é recusado com 400
+def test_report_period_invalid():
+    with pytest.raises(HTTPException) as exc:
+        _report_period(date(2024, 2, 1), date(2024, 1, 1))
+    assert exc.value.status_code == 400
+
+    response = client.get("/reports/sales/secao", params={"start": "2024-02-01", "end": "2024-01-01"}, headers=get_auth_header())
+    assert response.status_code == 400
+
+# Testa as rotas de vendas por seção e de produtos mais vendidos
+def test_sales_reports():
+    params = {"start": "2000-01-01", "end": date.today().isoformat()}
+    response = client.get("/reports/sales/secao", params=params, headers=get_auth_header())
+    assert response.status_code == 200
+    assert isinstance(response.json(), list)
+
+    response = client.get("/reports/sales/top-products", params=params, headers=get_auth_header())
+    assert response.status_code == 200
+    assert isinstance(response.json(), list)
@@ -0,0 +1,86 @@
+import os
+import time
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+from API.main import app
+from API import database, routes
+from API.config import get_secret_key
+import jwt
+
+SECRET_KEY = get_secret_key()
+
+# Função para obter autenticação
+def get_auth_header():
+    token_data = {"sub": "testuser"}
+    token = jwt.encode(token_data, SECRET_KEY, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+# Função para montar a requisição que chega a um endpoint, com cookies opcionais
+def make_request(method, endpoint, path, cookie=None):
+    headers = [(b"cookie", cookie.encode())] if cookie else []
+    return Request({"type": "http", "method": method, "path": path, "headers": headers, "query_string": b"", "app": app, "endpoint": endpoint})
+
+# Função para contar por onde passaram as conexões de uma requisição
+def routed(client, path):
+    before = database.routing_metrics()
+    response = client.get(path, headers=get_auth_header())
+    assert response.status_code == 200
+    after = database.routing_metrics()
+    return {target: after.get(target, 0) - before.get(target, 0) for target in ('read', 'write', 'fallback')}
+
+# Réplica apontando para o próprio banco de testes, com monitor e pool de leitura próprios
+@pytest.fixture
+def replica(monkeypatch):
+    monkeypatch.setattr(database, "READ_DATABASE_URL", os.getenv("DATABASE_URL"))
+    monitor = database.ReplicaMonitor()
+    monkeypatch.setattr(database, "replica_monitor", monitor)
+    yield monitor
+    pool = database._pools.pop('read', None)
+    if pool is not None:
+        pool.closeall()
+
+# Testa a escolha da conexão: GETs vão para a réplica, exceto escritas, rotas do primário e sessões com o cookie ativo
+def test_connection_role(replica):
+    assert database.connection_role(make_request("GET", routes.get_client_by_id, "/clients/1")) == 'read'
+    assert database.connection_role(make_request("PUT", routes.update_client, "/clients/1")) == 'write'
+    assert database.connection_role(make_request("GET", routes.product_changes, "/products/changes")) == 'write'
+    cookie = f"{database.PRIMARY_COOKIE}={int(time.time()) + 60}"
+    assert database.connection_role(make_request("GET", routes.get_client_by_id, "/clients/1", cookie)) == 'write'
+    cookie = f"{database.PRIMARY_COOKIE}={int(time.time()) - 60}"
+    assert database.connection_role(make_request("GET", routes.get_client_by_id, "/clients/1", cookie)) == 'read'
+    assert database.connection_role(make_request("GET", routes.get_client_by_id, "/clients/1", f"{database.PRIMARY_COOKIE}=x")) == 'read'
+
+# Testa que sem réplica configurada todas as conexões vão para o primário
+def test_connection_role_without_replica(monkeypatch):
+    monkeypatch.setattr(database, "READ_DATABASE_URL", None)
+    assert database.connection_role(make_request("GET", routes.get_client_by_id, "/clients/1")) == 'write'
+
+# Testa que uma escrita grava o cookie e mantém as leituras seguintes da sessão no primário
+def test_read_after_write_stays_on_primary(replica):
+    client = TestClient(app)
+    client_id = client.get("/clients", headers=get_auth_header()).json()[0]["id"]
+    assert routed(client, f"/clients/{client_id}") == {'read': 1, 'write': 0, 'fallback': 0}
+
+    response = client.post("/products/batch-get", json={"ids": [0]}, headers=get_auth_header())
+    assert response.status_code == 200
+    assert float(response.cookies[database.PRIMARY_COOKIE]) > time.time()
+    assert routed(client, f"/clients/{client_id}") == {'read': 0, 'write': 1, 'fallback': 0}
+
+# Testa que, com a réplica atrasada ou fora do ar, as leituras voltam para o primário
+def test_replica_fallback(replica, monkeypatch):
+    client = TestClient(app)
+    client_id = client.get("/clients", headers=get_auth_header()).json()[0]["id"]
+
+    monkeypatch.setattr(database, "REPLICA_MAX_LAG", -1)
+    replica.checked_at = 0.0
+    assert routed(client, f"/clients/{client_id}") == {'read': 0, 'write': 0, 'fallback': 1}
+    assert replica.lag == 0 and not replica.healthy
+
+    monkeypatch.setattr(database, "REPLICA_MAX_LAG", 5)
+    monkeypatch.setattr(database, "READ_DATABASE_URL", "postgresql://postgres:@/postgres?host=/nonexistent")
+    database._pools.pop('read').closeall()
+    replica.checked_at = 0.0
+    assert routed(client, f"/clients/{client_id}") == {'read': 0, 'write': 0, 'fallback': 1}
+    assert replica.lag is None and not replica.healthy
+    assert database.routing_metrics()['replica_configured']
@@ -0,0 +1,64 @@
+import random
+from fastapi.testclient import TestClient
+from API.main import app
+from API.config import get_secret_key
+import jwt
+
+client = TestClient(app)
+SECRET_KEY = get_secret_key()
+
+# Função para obter autenticação
+def get_auth_header():
+    token_data = {"sub": "testuser"}
+    token = jwt.encode(token_data, SECRET_KEY, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+# Função para criar um produto de teste
+def create_product(descricao, secao):
+    product = {
+        "descricao": descricao,
+        "valor_venda": 4.0,
+        "codigo_barras": str(random.randrange(10 ** 12, 10 ** 13)),
+        "secao": secao,
+        "estoque_inicial": 1,
+    }
+    response = client.post("/products", json=product, headers=get_auth_header())
+    assert response.status_code == 200
+    return response.json()["id"]
+
+# Função para buscar produtos e devolver apenas os ids
+def search(**params):
+    response = client.get("/products/search", params=params, headers=get_auth_header())
+    assert response.status_code == 200
+    return [product["id"] for product in response.json()]
+
+# Testa a busca por texto: filtro por seção, prefixo, ordenação pela relevância e paginação
+def test_search_products():
+    term = f"zq{random.randrange(10 ** 6)}"
+    secao = f"Busca {term}"
+    chocolate = create_product(f"Biscoito {term} chocolate", secao)
+    baunilha = create_product(f"Biscoito {term} baunilha", secao)
+
+    assert sorted(search(q=term)) == sorted([chocolate, baunilha])
+    assert search(q=f"{term} chocolate")[0] == chocolate
+    assert chocolate not in search(q=f"{term} chocolate", secao="Outra seção")
+    assert sorted(search(q=term, secao=secao)) == sorted([chocolate, baunilha])
+    assert chocolate in search(q=f"biscoito {term}", secao=secao)
+
+    first = search(q=term, secao=secao, limit=1)
+    second = search(q=term, secao=secao, limit=1, offset=1)
+    assert len(first) == len(second) == 1
+    assert first != second
+
+# Testa a busca pelo início da descrição, com %, _ e \ no termo tratados como texto
+def test_search_products_prefix():
+    term = f"zq{random.randrange(10 ** 6)}"
+    product_id = create_product(f"{term}_promo 100% natural", f"Busca {term}")
+    assert product_id in search(q=f"{term}_pro")
+    assert product_id in search(q=f"{term}_promo 100%")
+    assert search(q="%_\\", secao=f"Busca {term}") == []
+
+# Testa que a busca exige um termo
+def test_search_products_requires_term():
+    response = client.get("/products/search", params={"q": ""}, headers=get_auth_header())
+    assert response.status_code == 422
@@ -0,0 +1,39 @@
+from fastapi.testclient import TestClient
+from API.main import app
+from API import database, server
+from API.config import get_secret_key
+import jwt
+
+client = TestClient(app)
+SECRET_KEY = get_secret_key()
+
+# Função para obter autenticação
+def get_auth_header():
+    token_data = {"sub": "testuser"}
+    token = jwt.encode(token_data, SECRET_KEY, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+# Testa que o número de CPUs segue a afinidade do processo e a cota do cgroup, arredondada para cima
+def test_available_cpus(tmp_path, monkeypatch):
+    cpu_max = tmp_path / "cpu.max"
+    monkeypatch.setattr(server, "CGROUP_CPU_MAX", str(cpu_max))
+    monkeypatch.setattr(server.os, "sched_getaffinity", lambda pid: {0, 1, 2, 3}, raising=False)
+
+    assert server.available_cpus() == 4
+    cpu_max.write_text("max 100000\n")
+    assert server.available_cpus() == 4
+    cpu_max.write_text("150000 100000\n")
+    assert server.available_cpus() == 2
+    cpu_max.write_text("50000 100000\n")
+    assert server.available_cpus() == 1
+    cpu_max.write_text("800000 100000\n")
+    assert server.available_cpus() == 4
+
+# Testa que as conexões usadas pelas requisições voltam ao pool ao final de cada uma
+def test_connections_return_to_pool():
+    for _ in range(database.DB_POOL_MAX + 2):
+        response = client.get("/products/changes", params={"limit": 1}, headers=get_auth_header())
+        assert response.status_code == 200
+    pool = database.get_pool()
+    assert not pool._used
+    pool.putconn(pool.getconn(timeout=1))
@@ -0,0 +1,50 @@
+from fastapi.testclient import TestClient
+from API.main import app
+from API import database
+from API.database import get_connection
+from API.config import get_secret_key
+import jwt
+
+client = TestClient(app)
+SECRET_KEY = get_secret_key()
+
+# Função para obter autenticação
+def get_auth_header():
+    token_data = {"sub": "testuser"}
+    token = jwt.encode(token_data, SECRET_KEY, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+# Função para ler o contador de um comando em /metrics
+def statement_count(kind, name):
+    return database.statement_metrics()[kind].get(name, 0)
+
+# Testa que as conexões do pool executam o comando preparado e as conexões avulsas o SQL direto, com a mesma resposta
+def test_prepared_and_adhoc_statements():
+    with get_connection() as conn:
+        client_id = database.get_all_clients(conn)[0].id
+        adhoc = statement_count("adhoc", "get_client_id")
+        expected = database.get_client_id(conn, client_id)
+        assert statement_count("adhoc", "get_client_id") == adhoc + 1
+
+    prepared = statement_count("prepared", "get_client_id")
+    for _ in range(2):
+        response = client.get(f"/clients/{client_id}", headers=get_auth_header())
+        assert response.status_code == 200
+        assert response.json() == expected.model_dump()
+    assert statement_count("prepared", "get_client_id") == prepared + 2
+
+# Testa que o comando é preparado uma única vez por conexão do pool
+def test_statement_prepared_once_per_connection():
+    pool, conn = database._acquire(5)
+    try:
+        database.prepare_statements(conn)
+        assert set(database.PREPARED_STATEMENTS) <= conn.prepared
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) FROM pg_prepared_statements WHERE name = 'get_client_id'")
+            assert cur.fetchone()[0] == 1
+        database.prepare_statements(conn)
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) FROM pg_prepared_statements WHERE name = 'get_client_id'")
+            assert cur.fetchone()[0] == 1
+    finally:
+        database._release(pool, conn)
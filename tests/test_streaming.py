@@ -0,0 +1,69 @@
+import json
+from fastapi.testclient import TestClient
+from psycopg2 import sql
+from API.main import app
+from API import database
+from API.database import get_connection
+from API.config import get_secret_key
+import jwt
+
+client = TestClient(app)
+SECRET_KEY = get_secret_key()
+
+# Função para obter autenticação
+def get_auth_header():
+    token_data = {"sub": "testuser"}
+    token = jwt.encode(token_data, SECRET_KEY, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+# Testa que o array JSON lido em vários lotes do cursor no servidor é completo e que a conexão volta ao pool no fim
+def test_stream_table_batches(monkeypatch):
+    monkeypatch.setattr(database, "STREAM_BATCH_SIZE", 2)
+    stream = database.stream_table(5, 'clients', ('id', 'nome'))
+    chunks = list(stream)
+    assert len(chunks) > 2
+    with get_connection() as conn:
+        expected = [{"id": item.id, "nome": item.nome} for item in sorted(database.get_all_clients(conn), key=lambda item: item.id)]
+    assert json.loads(b''.join(chunks)) == expected
+    assert stream.conn is None
+    assert not database.get_pool()._used
+
+# Testa o array vazio e o fechamento da lista no meio da leitura, que devolve a conexão ao pool
+def test_stream_empty_and_close():
+    empty = database.stream_json_array(5, sql.SQL("SELECT '{}'::text WHERE false"))
+    assert b''.join(empty) == b'[]'
+
+    stream = database.stream_table(5, 'products', ('id',))
+    assert next(stream).startswith(b'[')
+    stream.close()
+    assert list(stream) == []
+    assert not database.get_pool()._used
+
+# Testa que as rotas de listagem devolvem as mesmas linhas, em ordem de id, lidas em lotes
+def test_list_routes_stream(monkeypatch):
+    monkeypatch.setattr(database, "STREAM_BATCH_SIZE", 2)
+    response = client.get("/products", headers=get_auth_header())
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    ids = [product["id"] for product in response.json()]
+    assert ids == sorted(ids)
+    with get_connection() as conn:
+        assert ids == sorted(product.id for product in database.get_all_products(conn))
+
+    response = client.get("/clients", params={"fields": "id"}, headers=get_auth_header())
+    assert response.status_code == 200
+    assert response.json() == [{"id": item_id} for item_id in sorted(item["id"] for item in response.json())]
+
+# Testa que, com o pool esgotado, a listagem responde 503 antes de começar o corpo em vez de um 200 truncado
+def test_list_route_pool_exhausted(monkeypatch):
+    monkeypatch.setattr(database, "REQUEST_DEADLINE", 0.2)
+    pool = database.get_pool()
+    held = [pool.getconn() for _ in range(database.DB_POOL_MAX)]
+    try:
+        response = client.get("/clients", headers=get_auth_header())
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+    finally:
+        for conn in held:
+            pool.putconn(conn)
+    assert client.get("/clients", headers=get_auth_header()).status_code == 200
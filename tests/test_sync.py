@@ -0,0 +1,83 @@
+import pytest
+from fastapi.testclient import TestClient
+from API.main import app
+from API.database import parse_change_cursor
+from API.config import get_secret_key
+import jwt
+
+client = TestClient(app)
+SECRET_KEY = get_secret_key()
+
+# Função para obter autenticação
+def get_auth_header():
+    token_data = {"sub": "testuser"}
+    token = jwt.encode(token_data, SECRET_KEY, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+# Função para percorrer todas as páginas de alterações a partir de um cursor
+def read_changes(path, since=None, limit=50):
+    seen = []
+    while True:
+        params = {"limit": limit, **({"since": since} if since else {})}
+        response = client.get(path, params=params, headers=get_auth_header())
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["items"]) + len(data["deleted"]) <= limit
+        seen += [item["id"] for item in data["items"]]
+        assert parse_change_cursor(data["cursor"]) >= parse_change_cursor(since)
+        since = data["cursor"]
+        if not data["has_more"]:
+            return seen, since
+
+# Testa a leitura do cursor de sincronização, vazio ou no formato "xid.id"
+def test_parse_change_cursor():
+    assert parse_change_cursor(None) == (0, 0)
+    assert parse_change_cursor("") == (0, 0)
+    assert parse_change_cursor("1234.56") == (1234, 56)
+    for cursor in ("abc", "1.2.3", "12", "1.x"):
+        with pytest.raises(ValueError):
+            parse_change_cursor(cursor)
+
+# Testa que um cursor inválido é recusado com 400
+def test_changes_invalid_cursor():
+    response = client.get("/products/changes", params={"since": "abc"}, headers=get_auth_header())
+    assert response.status_code == 400
+    response = client.get("/clients/changes", params={"since": "1.2.3"}, headers=get_auth_header())
+    assert response.status_code == 400
+
+# Testa a paginação das alterações de produtos: nenhuma linha se repete entre páginas e o último cursor não traz nada novo
+def test_product_changes_paging():
+    seen, cursor = read_changes("/products/changes", limit=2)
+    assert len(seen) == len(set(seen))
+
+    response = client.get("/products/changes", params={"since": cursor}, headers=get_auth_header())
+    assert response.status_code == 200
+    assert response.json() == {"items": [], "deleted": [], "cursor": cursor, "has_more": False}
+
+# Testa que um produto alterado volta a aparecer depois do último cursor
+def test_product_changes_after_update():
+    response = client.get("/products", headers=get_auth_header())
+    assert response.status_code == 200
+    product = response.json()[0]
+    _, cursor = read_changes("/products/changes")
+
+    response_update = client.patch("/products", json={"items": [{"id": product["id"], "valor_venda": product["valor_venda"]}]}, headers=get_auth_header())
+    assert response_update.status_code == 200
+
+    seen, _ = read_changes("/products/changes", since=cursor)
+    assert product["id"] in seen
+
+# Testa que a segunda página de alterações de clientes começa depois do cursor da primeira
+def test_client_changes_paging():
+    response = client.get("/clients/changes", params={"limit": 2}, headers=get_auth_header())
+    assert response.status_code == 200
+    first = response.json()
+
+    response = client.get("/clients/changes", params={"limit": 2, "since": first["cursor"]}, headers=get_auth_header())
+    assert response.status_code == 200
+    second = response.json()
+    first_ids = [item["id"] for item in first["items"]] + first["deleted"]
+    second_ids = [item["id"] for item in second["items"]] + second["deleted"]
+    assert not set(first_ids) & set(second_ids)
+    if second_ids:
+        assert parse_change_cursor(second["cursor"]) > parse_change_cursor(first["cursor"])